@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Zerodose.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# 앱 레지스트리가 준비된 뒤에 import 해야 합니다.
+from data.consumers import EMOTION_SOCKET_PATH, emotion_socket
+
+async def application(scope, receive, send):
+    """HTTP 는 Django 로, /ws/emotion/ WebSocket 은 감정 인식 스트림으로 보냅니다. (예: uvicorn Zerodose.asgi:application)"""
+    if scope['type'] == 'websocket':
+        if scope['path'] == EMOTION_SOCKET_PATH:
+            return await emotion_socket(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 4404})
+    return await django_application(scope, receive, send)
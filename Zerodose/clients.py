@@ -0,0 +1,105 @@
+"""
+외부 서비스 클라이언트(Gemini, Vision, Vertex AI Imagen, S3)를 프로세스 전체에서 공유하는 레지스트리.
+처음 사용할 때 한 번만 만들고(스레드 안전), 이후에는 같은 클라이언트와 연결(TLS 세션, gRPC 채널)을 재사용합니다.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+from Zerodose import metrics
+
+CLIENT_NAMES = ['gemini', 'vision', 'imagen', 's3']
+
+def _create_gemini_model():
+    import google.generativeai as genai
+    options = {'api_key': os.getenv("GEMINI_API_KEY")}
+    # GEMINI_API_ENDPOINT 가 있으면 REST 로 그 주소에 요청합니다. (로컬 테스트: python manage.py fake_gemini_server)
+    if settings.GEMINI_API_ENDPOINT:
+        options.update(transport='rest', client_options={'api_endpoint': settings.GEMINI_API_ENDPOINT})
+    genai.configure(**options)
+    return genai.GenerativeModel(settings.GEMINI_MODEL_NAME)
+
+def _create_vision_client():
+    from google.cloud import vision
+    if not settings.VISION_API_ENDPOINT:
+        return vision.ImageAnnotatorClient()
+    options = {'transport': 'rest', 'client_options': {'api_endpoint': settings.VISION_API_ENDPOINT}}
+    if settings.VISION_API_ENDPOINT.startswith('http://'):
+        # 로컬 가짜 서버(python manage.py fake_vision_server)에는 인증 정보가 필요 없습니다.
+        from google.auth.credentials import AnonymousCredentials
+        options['credentials'] = AnonymousCredentials()
+    return vision.ImageAnnotatorClient(**options)
+
+def _create_imagen_model():
+    import vertexai
+    from vertexai.preview.vision_models import ImageGenerationModel
+    vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
+    return ImageGenerationModel.from_pretrained(settings.IMAGEN_MODEL_NAME)
+
+def _create_s3_client():
+    import boto3
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_S3_REGION_NAME
+    )
+
+_FACTORIES = {
+    'gemini': _create_gemini_model,
+    'vision': _create_vision_client,
+    'imagen': _create_imagen_model,
+    's3': _create_s3_client,
+}
+_clients = {}
+_lock = threading.Lock()
+
+# gRPC 채널 등은 fork 후 재사용할 수 없으므로, Celery prefork 워커 같은 자식 프로세스에서는 새로 만듭니다.
+os.register_at_fork(after_in_child=_clients.clear)
+
+def get_client(name):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                start = time.perf_counter()
+                client = _FACTORIES[name]()
+                metrics.incr(f'clients.{name}.init_ms', int((time.perf_counter() - start) * 1000))
+                _clients[name] = client
+    return client
+
+def warm_up(names):
+    """서버 시작 시 클라이언트를 미리 만들어, 첫 요청이 생성/TLS 연결 비용을 기다리지 않게 합니다."""
+    for name in names:
+        try:
+            get_client(name)
+        except Exception as e:
+            print(f"Client warm-up failed for '{name}': {e}")
+
+@contextmanager
+def timed(name):
+    """외부 호출 횟수와 누적 지연 시간(ms)을 clients.<name>.calls / clients.<name>.latency_ms 에 기록합니다."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.incr(f'clients.{name}.calls')
+        metrics.incr(f'clients.{name}.latency_ms', int((time.perf_counter() - start) * 1000))
+
+def upload_to_s3(image_bytes, bucket_name, object_name):
+    """S3에 이미지 바이트를 업로드하고 URL을 반환하는 함수"""
+    from botocore.exceptions import NoCredentialsError
+    try:
+        with timed('s3'):
+            get_client('s3').put_object(Body=image_bytes, Bucket=bucket_name, Key=object_name, ContentType='image/png')
+        url = f"https://{bucket_name}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{object_name}"
+        return url
+    except NoCredentialsError:
+        print("S3 credentials not available")
+        return None
+    except Exception as e:
+        print(f"S3 upload failed: {e}")
+        return None
@@ -0,0 +1,47 @@
+"""
+간단한 카운터 기반 메트릭.
+Django 캐시에 저장되므로 운영(Redis)에서는 모든 워커가 같은 값을 공유하고, 로컬(locmem)에서는 프로세스별로 집계됩니다.
+"""
+from django.core.cache import cache
+
+METRIC_PREFIX = 'metrics:'
+
+# /api/data/metrics/ 에서 노출할 카운터 이름 목록
+METRIC_NAMES = [
+    'stats_cache.hit',
+    'stats_cache.miss',
+    'ai_analysis.llm_call',
+    'ai_analysis.skipped',
+    'ai_analysis.prompt_tokens',  # Gemini 로 보낸 프롬프트의 예상 토큰 수 합계
+    'emotion_image.bytes_in',  # 전처리 전/후 이미지 바이트 합계
+    'emotion_image.bytes_out',
+    'emotion_image.rejected',
+    'emotion_cache.hit',  # 비슷한 프레임이라 Vision 호출 없이 답한 횟수
+    'emotion_cache.miss',
+    'emotion_ws.frames',  # WebSocket 으로 받은 프레임 수
+    'emotion_ws.dropped',  # 처리 중에 더 새로운 프레임이 와서 건너뛴 프레임 수
+    'quiz_pool.requests',  # 퀴즈 조회 요청 수
+    'quiz_pool.depth_sum',  # 조회 시점의 준비된 퀴즈 수 합계 (÷ requests = 평균 풀 깊이)
+    'quiz_pool.empty',  # 조회 시 퀴즈가 3개 미만이라 바로 줄 수 없었던 횟수
+    'quiz_pool.refills',  # 풀 채우기 작업을 넣은 횟수
+] + [
+    # 외부 클라이언트별 호출 수 / 누적 지연 시간(ms) / 클라이언트 생성 시간(ms) (Zerodose/clients.py)
+    f'clients.{name}.{field}'
+    for name in ['gemini', 'vision', 'imagen', 's3']
+    for field in ['calls', 'latency_ms', 'init_ms']
+]
+
+def incr(name, amount=1):
+    # 키는 처음 한 번만 만들어지므로 incr 를 먼저 시도합니다. (Redis 에서 add 를 먼저 하면 카운터마다 왕복이 한 번 더 듭니다)
+    key = METRIC_PREFIX + name
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, timeout=None):
+            # 다른 요청이 그 사이에 키를 만든 경우
+            cache.incr(key, amount)
+
+def snapshot(names=None):
+    names = names or METRIC_NAMES
+    values = cache.get_many([METRIC_PREFIX + name for name in names])
+    return {name: values.get(METRIC_PREFIX + name, 0) for name in names}
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 import environ  # ⇐ 추가
+from celery.schedules import crontab
 from dotenv import load_dotenv
 load_dotenv()
 GPT_API_KEY = os.getenv("GPT_API_KEY")
@@ -47,6 +48,11 @@ elif env('GOOGLE_APPLICATION_CREDENTIALS', default=None):
 # settings.py
 GCP_PROJECT_ID = "gen-lang-client-0453288227"  # 본인의 GCP 프로젝트 ID로 교체
 GCP_LOCATION = "us-central1"           # 예: us-central1
+IMAGEN_MODEL_NAME = "imagegeneration@005"
+GEMINI_MODEL_NAME = "gemini-1.5-pro-latest"
+# 서버 시작 시(AppConfig.ready) 미리 만들어 둘 외부 클라이언트 (gemini, vision, imagen, s3 중 선택). 예: CLIENT_WARMUP=vision,gemini
+# Celery prefork 워커는 fork 후 클라이언트를 새로 만들기 때문에 웹 서버 프로세스에서만 의미가 있습니다.
+CLIENT_WARMUP = env.list('CLIENT_WARMUP', default=[])
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -170,6 +176,9 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# 일일 통계('오늘', 날짜별 추이)를 나누는 기준 시간대. 로그/세션의 local_date 컬럼이 이 기준으로 저장됩니다.
+STATS_TIME_ZONE = env('STATS_TIME_ZONE', default='Asia/Seoul')
+
 USE_I18N = True
 
 USE_TZ = True
@@ -187,10 +196,80 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# --- 퀴즈 이미지 라이브러리 (games/quiz_images.py) ---
+QUIZ_IMAGE_STYLE_VERSION = 'v1'  # 이미지 프롬프트 템플릿을 바꾸면 올립니다. 이전 버전 이미지는 사용하지 않습니다.
+QUIZ_IMAGE_POOL_SIZE = 3  # 프롬프트마다 모아 둘 이미지 수 (다양성)
+# 사용자별 준비된 퀴즈 풀: LOW 아래로 내려가면 Celery 로 HIGH 까지 채웁니다. (games/task.py)
+QUIZ_POOL_LOW_WATERMARK = 6
+QUIZ_POOL_HIGH_WATERMARK = 12
+QUIZ_POOL_REFILL_LOCK_TIMEOUT = 60 * 10  # 사용자당 채우기 작업 중복 방지 잠금 유지 시간(초)
+
+INTERACTION_LOG_BATCH_MAX_SIZE = 500  # /api/games/interaction/log/batch/ 한 번에 받을 수 있는 최대 로그 수
+
+# --- 캐시 설정 ---
+# Celery 워커와 웹 서버가 작업 잠금/통계 캐시 버전을 공유해야 하므로 기본값은 Redis 입니다. (브로커와 같은 서버의 1번 DB)
+# REDIS_CACHE_URL= (빈 값)이면 프로세스별 메모리 캐시를 사용하며, 이때 AI 분석은 Celery 큐에 넣지 않고 거절합니다. (data/tasks.py)
+REDIS_CACHE_URL = env('REDIS_CACHE_URL', default='redis://localhost:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+    } if REDIS_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+STATS_CACHE_TIMEOUT = 60 * 60 * 24  # 통계 캐시 유지 시간(초). 데이터가 바뀌면 버전 키로 즉시 무효화됩니다.
+STATS_ITERATOR_CHUNK_SIZE = 2000  # 통계/롤업 재계산 시 QuerySet.iterator() 로 한 번에 가져올 행 수
+STATS_DELTA_CURSOR_OVERLAP_SECONDS = 60  # since 커서를 이만큼 앞당겨 발급해, 커밋이 늦은 쓰기도 다음 증분 조회에 포함되게 합니다.
+COHORT_STATS_MAX_USERS = 100  # /api/data/user-stats/batch/ 한 번에 요청할 수 있는 최대 아동 수
+
+# --- 감정 인식 이미지 전처리 (data/image_utils.py) ---
+EMOTION_IMAGE_MAX_BYTES = 5 * 1024 * 1024  # 이보다 큰 이미지는 디코딩 전에 413 으로 거절합니다.
+EMOTION_IMAGE_MAX_PIXELS = 4096 * 4096  # 가로x세로가 이보다 큰 이미지는 디코딩 전에 413 으로 거절합니다. (작은 PNG 로 메모리를 고갈시키는 요청 방지)
+EMOTION_IMAGE_MAX_EDGE = 640  # 긴 변을 이 크기(px)로 줄여서 Vision 에 보냅니다.
+EMOTION_IMAGE_CENTER_CROP_RATIO = 1.0  # 1 보다 작으면 가운데 영역(가로/세로 비율)만 잘라서 보냅니다. 예: 0.8
+EMOTION_IMAGE_JPEG_QUALITY = 85
+# 비슷한 프레임(dHash 해밍 거리 이하)의 감정 인식 결과를 잠깐 재사용합니다. (data/emotion_utils.py)
+EMOTION_CACHE_TTL = 5  # 초. 0 이면 캐시를 사용하지 않습니다.
+EMOTION_CACHE_HASH_DISTANCE = 4  # 64비트 중 다른 비트 수가 이 값 이하이면 같은 프레임으로 봅니다.
+EMOTION_CACHE_MAX_FRAMES = 8  # 범위(세션)별로 기억할 최근 프레임 수
+EMOTION_BATCH_MAX_FRAMES = 8  # /api/data/detect-emotion/batch/ 한 번에 받을 최대 프레임 수 (Vision 동기 배치 한도는 16)
+# Vision API 주소를 바꿀 때 사용합니다. 로컬 테스트: VISION_API_ENDPOINT=http://127.0.0.1:8766 + python manage.py fake_vision_server
+VISION_API_ENDPOINT = env('VISION_API_ENDPOINT', default=None)
+
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0' # Redis 서버 주소
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'Asia/Seoul'
\ No newline at end of file
+CELERY_TIMEZONE = 'Asia/Seoul'
+# autodiscover_tasks 는 tasks.py 만 찾으므로 games/task.py 는 직접 등록합니다.
+CELERY_IMPORTS = ['games.task']
+
+# AI 분석 작업은 전용 큐로 보내서 동시 실행 수를 워커 concurrency 로 제한합니다.
+#   celery -A Zerodose worker -Q ai-analysis -c 4
+CELERY_TASK_ROUTES = {
+    'data.tasks.run_game_analysis': {'queue': 'ai-analysis'},
+    'data.tasks.run_nightly_analysis': {'queue': 'ai-analysis'},
+}
+# celery -A Zerodose beat 로 실행합니다. (시간은 CELERY_TIMEZONE 기준)
+CELERY_BEAT_SCHEDULE = {
+    'nightly-ai-analysis': {
+        'task': 'data.tasks.run_nightly_analysis',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+AI_ANALYSIS_JOB_LOCK_TIMEOUT = 60 * 30  # (user, game) 중복 방지 잠금 유지 시간(초). 워커가 죽어도 이 시간 뒤에는 다시 요청할 수 있습니다.
+# 같은 통계로 다시 분석을 요청하면 저장된 결과를 재사용합니다. 이 시간(초)이 지나면 통계가 같아도 다시 분석합니다. 0 이면 만료 없음.
+AI_ANALYSIS_CACHE_TTL = env.int('AI_ANALYSIS_CACHE_TTL', default=0) or None
+# AI 분석 프롬프트 압축: 최근 N일은 일별로, 그 이전은 최근 N주의 주별 평균으로 보내고 나머지는 하나로 묶습니다.
+AI_ANALYSIS_TREND_RECENT_DAYS = 14
+AI_ANALYSIS_TREND_MAX_WEEKS = 8
+AI_ANALYSIS_PROMPT_TOKEN_BUDGET = 2000  # 게임 하나당 예상 토큰 수 상한. 넘으면 추이를 더 줄입니다.
+# 야간 일괄 AI 분석 (python manage.py run_nightly_analysis)
+AI_ANALYSIS_NIGHTLY_CONCURRENCY = 4  # 동시에 보내는 Gemini 요청 수
+AI_ANALYSIS_NIGHTLY_RPM = 60  # 분당 최대 Gemini 요청 수 (0 = 제한 없음)
+# Gemini API 주소를 바꿀 때 사용합니다. 로컬 테스트: GEMINI_API_ENDPOINT=http://127.0.0.1:8765 + python manage.py fake_gemini_server
+GEMINI_API_ENDPOINT = env('GEMINI_API_ENDPOINT', default=None)
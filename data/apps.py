@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class DataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'data'
+
+    def ready(self):
+        from django.conf import settings
+        from Zerodose.clients import warm_up
+        # CLIENT_WARMUP 에 지정한 외부 클라이언트를 서버 시작 시 미리 만들어 둡니다.
+        warm_up(settings.CLIENT_WARMUP)
@@ -0,0 +1,56 @@
+# data/cache_utils.py
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+from Zerodose import metrics
+
+_MISSING = object()
+# 같은 프로세스 안에서만 보이는 캐시 백엔드
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+def is_cache_shared():
+    """캐시를 Celery 워커 등 다른 프로세스와 공유하는지 여부. 공유하지 않으면 작업 잠금 해제와 통계 버전 갱신이 서로 보이지 않습니다."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+def release_lock(key, token):
+    """
+    cache.add(key, token) 로 잡은 잠금을 token 이 그대로일 때만 지웁니다.
+    잠금이 만료된 뒤 다른 요청이 새로 잡은 잠금을 이전 작업이 지워 중복 작업이 생기는 것을 막습니다.
+    """
+    if cache.get(key) == token:
+        cache.delete(key)
+
+def _version_key(user_id):
+    return f'stats-version:{user_id}'
+
+def get_stats_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # 버전 키가 만료/삭제되면 이전 값과 겹치지 않도록 현재 시각(ms)으로 다시 시작합니다.
+        cache.add(_version_key(user_id), int(time.time() * 1000), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+def bump_stats_version(user_id):
+    """사용자의 게임 데이터가 바뀌었을 때 호출하여, 이전 버전의 통계 캐시를 모두 무효화합니다."""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), int(time.time() * 1000), timeout=None)
+
+def get_or_build_stats(user_id, name, builder, *key_parts):
+    """(사용자 버전, name, key_parts) 로 캐시된 통계를 반환하고, 없으면 builder() 로 만들어 저장합니다."""
+    key = ':'.join(str(part) for part in ('stats', user_id, get_stats_version(user_id), name, *key_parts))
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        metrics.incr('stats_cache.hit')
+        return value
+    metrics.incr('stats_cache.miss')
+    value = builder()
+    cache.set(key, value, settings.STATS_CACHE_TIMEOUT)
+    return value
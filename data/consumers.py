@@ -0,0 +1,105 @@
+# data/consumers.py
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+from django.conf import settings
+
+from Zerodose import metrics
+from .image_utils import ImageTooLargeError, decode_data_url, preprocess_face_image
+from .emotion_utils import detect_face_likelihoods, match_emotion
+
+EMOTION_SOCKET_PATH = '/ws/emotion/'
+
+def _detect(frame, scope):
+    if isinstance(frame, str):
+        frame = decode_data_url(frame)
+    return detect_face_likelihoods(preprocess_face_image(frame), scope)
+
+def _flush_counts(counts):
+    for name, value in counts.items():
+        if value:
+            metrics.incr(name, value)
+
+async def emotion_socket(scope, receive, send):
+    """
+    게임 2 감정 인식 WebSocket (ws://<host>/ws/emotion/?target_emotion=happy&session_id=12)
+    - 클라이언트 -> 서버: 바이너리 메시지(이미지 바이트) 또는 텍스트 JSON {"image": "<base64 data URL>", "target_emotion": "sad"}
+    - 서버 -> 클라이언트: {"frame": 번호, "is_match": bool, "target_emotion": ...} 또는 {"frame": 번호, "error": ...}
+    연결당 Vision 요청은 하나만 실행하고, 그동안 들어온 프레임은 가장 최근 것 하나만 남기고 버립니다.
+    """
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    params = parse_qs(scope.get('query_string', b'').decode())
+    session_id = params.get('session_id', [''])[0]
+    state = {
+        'target_emotion': params.get('target_emotion', [None])[0],
+        'scope': session_id if session_id.isdigit() else None,  # session_id 가 없으면 캐시를 쓰지 않습니다.
+        'frame': None,
+        'seq': 0,
+    }
+    counts = {'emotion_ws.frames': 0, 'emotion_ws.dropped': 0}
+    frame_ready = asyncio.Event()
+    await send({'type': 'websocket.accept'})
+
+    async def send_json(data):
+        await send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    async def detect_loop():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, seq = state['frame'], state['seq']
+            state['frame'] = None
+            try:
+                # Vision 호출은 블로킹이므로 스레드에서 실행해 이벤트 루프(다른 연결)를 막지 않습니다.
+                likelihoods = await asyncio.to_thread(_detect, frame, state['scope'])
+            except ImageTooLargeError as e:
+                await send_json({'frame': seq, 'error': str(e)})
+                continue
+            except (ValueError, OSError):
+                await send_json({'frame': seq, 'error': 'Invalid image data'})
+                continue
+            except Exception as e:
+                # Vision 오류 등으로 루프가 끝나면 연결은 열려 있는데 응답이 끊기므로, 프레임 오류로 알리고 계속 처리합니다.
+                print(f"Emotion detection failed for frame {seq}: {e}")
+                await send_json({'frame': seq, 'error': 'Emotion detection failed'})
+                continue
+            if likelihoods is None:
+                await send_json({'frame': seq, 'error': 'No face detected'})
+            else:
+                await send_json({'frame': seq, 'is_match': match_emotion(likelihoods, state['target_emotion']), 'target_emotion': state['target_emotion']})
+
+    worker = asyncio.create_task(detect_loop())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+
+            frame = event.get('bytes')
+            if event.get('text'):
+                try:
+                    message = json.loads(event['text'])
+                except ValueError:
+                    await send_json({'error': 'Invalid JSON message'})
+                    continue
+                state['target_emotion'] = message.get('target_emotion', state['target_emotion'])
+                frame = message.get('image')
+            if not frame:
+                continue
+            if len(frame) > settings.EMOTION_IMAGE_MAX_BYTES * 4 // 3:
+                await send_json({'error': 'Image is too large.'})
+                continue
+
+            counts['emotion_ws.frames'] += 1
+            if state['frame'] is not None:
+                counts['emotion_ws.dropped'] += 1  # 처리되기 전에 더 새로운 프레임이 들어옴
+            state['frame'] = frame
+            state['seq'] += 1
+            frame_ready.set()
+    finally:
+        worker.cancel()
+        await asyncio.to_thread(_flush_counts, counts)
@@ -0,0 +1,112 @@
+# data/emotion_utils.py
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+from google.cloud import vision
+
+from Zerodose import metrics
+from Zerodose.clients import get_client, timed
+from .image_utils import frame_dhash
+
+# target_emotion -> Vision FaceAnnotation 필드
+EMOTION_LIKELIHOOD_FIELDS = {
+    'happy': 'joy_likelihood',
+    'sad': 'sorrow_likelihood',
+    'surprised': 'surprise_likelihood',
+    'angry': 'anger_likelihood',
+}
+MATCH_LIKELIHOOD = 3  # Likelihood.POSSIBLE 이상이면 일치로 봅니다.
+
+def match_emotion(likelihoods, target_emotion):
+    field = EMOTION_LIKELIHOOD_FIELDS.get(target_emotion)
+    return field is not None and likelihoods[field] >= MATCH_LIKELIHOOD
+
+def _face_likelihoods(face_annotations):
+    """첫 번째 얼굴의 감정 likelihood (Vision Likelihood 값 0~5). 얼굴이 없으면 None"""
+    if not face_annotations:
+        return None
+    return {field: int(getattr(face_annotations[0], field)) for field in EMOTION_LIKELIHOOD_FIELDS.values()}
+
+def _frames_key(scope):
+    return f'emotion-frames:{scope}'
+
+def find_cached_likelihoods(scope, frame_hash):
+    """
+    scope 안에서 최근 EMOTION_CACHE_TTL 초 이내에 본, 해시 거리가 EMOTION_CACHE_HASH_DISTANCE 이하인 프레임의 결과.
+    반환값: (찾았는지, likelihoods). 얼굴이 없던 프레임이면 likelihoods 는 None 입니다.
+    """
+    now = time.time()
+    best = None
+    for cached_hash, likelihoods, stored_at in cache.get(_frames_key(scope), []):
+        distance = (cached_hash ^ frame_hash).bit_count()
+        if now - stored_at <= settings.EMOTION_CACHE_TTL and distance <= settings.EMOTION_CACHE_HASH_DISTANCE and (best is None or distance < best[0]):
+            best = (distance, likelihoods)
+    return (True, best[1]) if best else (False, None)
+
+def cache_likelihoods(scope, frame_hash, likelihoods):
+    """scope 별로 최근 프레임 EMOTION_CACHE_MAX_FRAMES 개만 유지합니다."""
+    now = time.time()
+    frames = [frame for frame in cache.get(_frames_key(scope), []) if now - frame[2] <= settings.EMOTION_CACHE_TTL]
+    frames = [(frame_hash, likelihoods, now)] + frames[:settings.EMOTION_CACHE_MAX_FRAMES - 1]
+    cache.set(_frames_key(scope), frames, settings.EMOTION_CACHE_TTL)
+
+def _use_cache(scope):
+    # 범위(게임 세션)가 없으면 다른 사용자의 프레임 결과를 돌려줄 수 있으므로 캐시를 쓰지 않습니다.
+    return bool(settings.EMOTION_CACHE_TTL) and scope is not None
+
+def detect_face_likelihoods(image_content, scope=None):
+    """
+    첫 번째 얼굴의 감정 likelihood({joy_likelihood: 0~5, ...})를 반환합니다. 얼굴이 없으면 None.
+    아이가 표정을 유지하는 동안 거의 같은 프레임이 반복되므로, 비슷한 프레임은 Vision 호출 없이 캐시에서 답합니다.
+    target_emotion 과 관계없이 likelihood 를 저장하므로 다른 감정을 물어도 재사용됩니다.
+    scope(게임 세션)가 None 이면 캐시를 쓰지 않습니다.
+    """
+    use_cache = _use_cache(scope)
+    if use_cache:
+        frame_hash = frame_dhash(image_content)
+        found, likelihoods = find_cached_likelihoods(scope, frame_hash)
+        if found:
+            metrics.incr('emotion_cache.hit')
+            return likelihoods
+        metrics.incr('emotion_cache.miss')
+
+    with timed('vision'):
+        response = get_client('vision').face_detection(image=vision.Image(content=image_content))
+    likelihoods = _face_likelihoods(response.face_annotations)
+
+    if use_cache:
+        cache_likelihoods(scope, frame_hash, likelihoods)
+    return likelihoods
+
+def detect_face_likelihoods_batch(image_contents, scope=None):
+    """
+    여러 프레임을 Vision batch_annotate_images 한 번으로 처리합니다. 캐시에 있는 프레임은 요청에서 뺍니다.
+    반환값: 프레임 순서대로 (likelihoods, error) 목록. 얼굴이 없으면 likelihoods 는 None, error 는 'No face detected'.
+    """
+    results = [None] * len(image_contents)
+    hashes = [frame_dhash(content) for content in image_contents] if _use_cache(scope) else None
+    pending = []
+    for index, content in enumerate(image_contents):
+        if hashes is not None:
+            found, likelihoods = find_cached_likelihoods(scope, hashes[index])
+            metrics.incr('emotion_cache.hit' if found else 'emotion_cache.miss')
+            if found:
+                results[index] = (likelihoods, None if likelihoods else 'No face detected')
+                continue
+        pending.append(index)
+
+    if pending:
+        feature = vision.Feature(type_=vision.Feature.Type.FACE_DETECTION, max_results=1)
+        requests = [vision.AnnotateImageRequest(image=vision.Image(content=image_contents[index]), features=[feature]) for index in pending]
+        with timed('vision'):
+            response = get_client('vision').batch_annotate_images(requests=requests)
+        for index, annotated in zip(pending, response.responses):
+            if annotated.error.message:
+                results[index] = (None, annotated.error.message)
+                continue
+            likelihoods = _face_likelihoods(annotated.face_annotations)
+            results[index] = (likelihoods, None if likelihoods else 'No face detected')
+            if hashes is not None:
+                cache_likelihoods(scope, hashes[index], likelihoods)
+    return results
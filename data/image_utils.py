@@ -0,0 +1,90 @@
+# data/image_utils.py
+
+import base64
+import math
+from io import BytesIO
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from Zerodose import metrics
+
+class ImageTooLargeError(ValueError):
+    pass
+
+def check_base64_size(encoded):
+    """디코딩 전에 base64 길이로 원본 크기를 계산해, EMOTION_IMAGE_MAX_BYTES 를 넘으면 바로 거절합니다."""
+    if len(encoded) * 3 // 4 > settings.EMOTION_IMAGE_MAX_BYTES:
+        metrics.incr('emotion_image.rejected')
+        raise ImageTooLargeError(f"Image is larger than {settings.EMOTION_IMAGE_MAX_BYTES} bytes.")
+
+def decode_data_url(image_data):
+    """'data:image/...;base64,<데이터>' 또는 순수 base64 문자열을 바이트로 디코딩합니다."""
+    encoded = image_data.split(",", 1)[1] if "," in image_data else image_data
+    check_base64_size(encoded)
+    return base64.b64decode(encoded)
+
+def open_image(image_bytes):
+    """
+    이미지를 엽니다. (헤더만 읽고 아직 디코딩하지 않음)
+    파일 크기가 작아도 픽셀 수가 많으면 디코딩에 수백 MB 가 필요하므로, 디코딩 전에 EMOTION_IMAGE_MAX_PIXELS 로 거절합니다.
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+    except Image.DecompressionBombError:
+        image = None
+    if image is None or image.width * image.height > settings.EMOTION_IMAGE_MAX_PIXELS:
+        metrics.incr('emotion_image.rejected')
+        raise ImageTooLargeError(f"Image has more than {settings.EMOTION_IMAGE_MAX_PIXELS} pixels.")
+    return image
+
+def _center_crop(image, ratio):
+    width, height = image.size
+    crop_width, crop_height = int(width * ratio), int(height * ratio)
+    left, top = (width - crop_width) // 2, (height - crop_height) // 2
+    return image.crop((left, top, left + crop_width, top + crop_height))
+
+def preprocess_face_image(image_bytes):
+    """
+    Vision 얼굴 인식 전에 카메라 프레임을 줄입니다.
+    (선택) 가운데 자르기 -> 긴 변을 EMOTION_IMAGE_MAX_EDGE 로 축소 -> JPEG 재인코딩.
+    처리 결과가 원본보다 크면(이미 작은 JPEG 등) 원본을 그대로 사용합니다.
+    """
+    if len(image_bytes) > settings.EMOTION_IMAGE_MAX_BYTES:
+        metrics.incr('emotion_image.rejected')
+        raise ImageTooLargeError(f"Image is larger than {settings.EMOTION_IMAGE_MAX_BYTES} bytes.")
+
+    max_edge = settings.EMOTION_IMAGE_MAX_EDGE
+    crop_ratio = settings.EMOTION_IMAGE_CENTER_CROP_RATIO
+    image = open_image(image_bytes)
+    # JPEG 은 디코딩 단계에서 1/2, 1/4, 1/8 로 줄여 읽을 수 있어 큰 프레임의 디코딩 시간이 크게 줄어듭니다.
+    draft_edge = max_edge / crop_ratio if crop_ratio < 1 else max_edge
+    scale = min(draft_edge / max(image.size), 1)
+    image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    if crop_ratio < 1:
+        image = _center_crop(image, crop_ratio)
+    image.thumbnail((max_edge, max_edge), Image.Resampling.BILINEAR)
+
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=settings.EMOTION_IMAGE_JPEG_QUALITY)
+    processed = output.getvalue()
+    if len(processed) >= len(image_bytes) and crop_ratio >= 1:
+        processed = image_bytes
+
+    metrics.incr('emotion_image.bytes_in', len(image_bytes))
+    metrics.incr('emotion_image.bytes_out', len(processed))
+    return processed
+
+def frame_dhash(image_bytes):
+    """
+    64비트 difference hash. 밝기 변화 방향만 보므로 재인코딩/약간의 노이즈에는 거의 바뀌지 않습니다.
+    두 해시의 해밍 거리((a ^ b).bit_count())가 작을수록 비슷한 프레임입니다.
+    """
+    image = open_image(image_bytes)
+    image.draft('L', (64, 64))
+    pixels = list(image.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
@@ -0,0 +1,72 @@
+# data/management/commands/benchmark_image_preprocess.py
+
+import statistics
+import time
+from io import BytesIO
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageDraw
+
+from data.image_utils import preprocess_face_image
+
+SYNTHETIC_SIZES = [(1280, 720), (1920, 1080), (4032, 3024)]
+
+def synthetic_frame(width, height):
+    """얼굴 비슷한 도형이 있는 합성 카메라 프레임 (JPEG 바이트)"""
+    image = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 4):
+        draw.line([(0, y), (width, y)], fill=(y * 255 // height, 120, 255 - y * 255 // height))
+    cx, cy, r = width // 2, height // 2, min(width, height) // 4
+    draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=(230, 190, 160))
+    draw.ellipse([cx - r // 2, cy - r // 3, cx - r // 4, cy - r // 6], fill=(40, 40, 40))
+    draw.ellipse([cx + r // 4, cy - r // 3, cx + r // 2, cy - r // 6], fill=(40, 40, 40))
+    draw.arc([cx - r // 2, cy, cx + r // 2, cy + r // 2], 20, 160, fill=(150, 40, 40), width=max(2, r // 20))
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=95)
+    return output.getvalue()
+
+class Command(BaseCommand):
+    help = 'Measures the DetectEmotionView image preprocessing (time and bytes) over sample frames, optionally timing Vision face detection before/after.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directory of sample frames (jpg/png). Synthetic frames are generated when omitted.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--with-vision', action='store_true', help='Also time face_detection on the original and the processed frame.')
+
+    def handle(self, *args, **options):
+        if options['dir']:
+            paths = sorted(p for p in Path(options['dir']).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+            if not paths:
+                raise CommandError(f"No jpg/png files in {options['dir']}")
+            frames = [(p.name, p.read_bytes()) for p in paths]
+        else:
+            frames = [(f'synthetic {w}x{h}', synthetic_frame(w, h)) for w, h in SYNTHETIC_SIZES]
+
+        if options['with_vision']:
+            from google.cloud import vision
+            from Zerodose.clients import get_client
+
+            def detect_ms(content):
+                start = time.perf_counter()
+                get_client('vision').face_detection(image=vision.Image(content=content))
+                return (time.perf_counter() - start) * 1000
+
+        total_in, total_out = 0, 0
+        for name, original in frames:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                processed = preprocess_face_image(original)
+                timings.append((time.perf_counter() - start) * 1000)
+            total_in += len(original)
+            total_out += len(processed)
+            line = (
+                f"{name}: {len(original) / 1024:.0f}KiB -> {len(processed) / 1024:.0f}KiB "
+                f"({len(processed) / len(original):.0%}), preprocess median {statistics.median(timings):.1f}ms"
+            )
+            if options['with_vision']:
+                line += f", vision {detect_ms(original):.0f}ms -> {detect_ms(processed):.0f}ms"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(f"합계: {total_in / 1024:.0f}KiB -> {total_out / 1024:.0f}KiB ({total_out / total_in:.0%})"))
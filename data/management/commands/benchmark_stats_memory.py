@@ -0,0 +1,98 @@
+# data/management/commands/benchmark_stats_memory.py
+
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import User
+from games.models import GameSession, GameInteractionLog, GameDailyStat, to_local_date
+from games.rollup_utils import create_interaction_logs, compute_daily_buckets
+from data.cache_utils import bump_stats_version
+from data.views import _generate_comprehensive_stats
+
+ASSISTANCE_LEVELS = ['NONE', 'VERBAL', 'PHYSICAL']
+
+class Command(BaseCommand):
+    help = 'Creates a synthetic user with many interaction logs and reports peak Python memory of the stats paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logs', type=int, default=500000, help='Number of synthetic interaction logs.')
+        parser.add_argument('--logs-per-session', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--max-peak-mb', type=float, help='Fail when any measured stage exceeds this peak (MiB).')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic data instead of deleting it.')
+
+    def _create_synthetic_user(self, total_logs, logs_per_session, batch_size):
+        user = User.objects.create(username=f'__stats_benchmark_{int(time.time())}__', point=0)
+        session_count = max(1, total_logs // logs_per_session)
+        start = timezone.now() - timedelta(days=365)
+
+        # bulk_create 는 save()를 거치지 않으므로 local_date 를 직접 채웁니다.
+        sessions = []
+        for i in range(session_count):
+            started = start + timedelta(minutes=i * 30)
+            sessions.append(GameSession(
+                user_id=user.user_id, game_id=(i % 3) + 1, assistance_level=random.choice(ASSISTANCE_LEVELS),
+                session_start_time=started, session_end_time=started + timedelta(minutes=10), local_date=to_local_date(started),
+            ))
+        GameSession.objects.bulk_create(sessions, batch_size=batch_size)
+        session_rows = list(GameSession.objects.filter(user_id=user.user_id).values_list('session_id', 'session_start_time'))
+
+        items = []
+        for i in range(total_logs):
+            session_id, started = session_rows[i % len(session_rows)]
+            items.append({
+                'session_id': session_id,
+                'timestamp': started + timedelta(seconds=i % logs_per_session),
+                'is_successful': random.random() < 0.6,
+                'response_time_ms': random.randint(300, 6000),
+                'interaction_data': {'throw_power': random.randint(10, 120)},
+            })
+            if len(items) >= batch_size:
+                with transaction.atomic():
+                    create_interaction_logs(items)
+                items = []
+        if items:
+            with transaction.atomic():
+                create_interaction_logs(items)
+        return user
+
+    def _measure(self, label, fn):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / (1024 * 1024)
+        self.stdout.write(f"{label}: peak {peak_mb:.2f} MiB, {elapsed * 1000:.0f} ms")
+        return peak_mb
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"합성 사용자 생성 중... (로그 {options['logs']}개)")
+        user = self._create_synthetic_user(options['logs'], options['logs_per_session'], options['batch_size'])
+        user_id = user.user_id
+
+        try:
+            bump_stats_version(user_id)  # 캐시를 건너뛰고 실제 계산 경로를 측정합니다.
+            peaks = {
+                'comprehensive stats (rollup)': self._measure('comprehensive stats (rollup)', lambda: _generate_comprehensive_stats(user_id)),
+                'rebuild buckets (raw logs)': self._measure('rebuild buckets (raw logs)', lambda: compute_daily_buckets(user_id)),
+            }
+        finally:
+            if not options['keep']:
+                GameInteractionLog.objects.filter(user_id=user_id).delete()
+                GameSession.objects.filter(user_id=user_id).delete()
+                GameDailyStat.objects.filter(user_id=user_id).delete()
+                user.delete()
+
+        limit = options['max_peak_mb']
+        over = [label for label, peak in peaks.items() if limit is not None and peak > limit]
+        if over:
+            raise CommandError(f"메모리 상한({limit} MiB) 초과: {', '.join(over)}")
+        self.stdout.write(self.style.SUCCESS("메모리 벤치마크 완료"))
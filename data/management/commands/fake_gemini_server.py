@@ -0,0 +1,41 @@
+# data/management/commands/fake_gemini_server.py
+
+import json
+import re
+from django.core.management.base import BaseCommand
+
+from data.management.fake_server import serve_fake_api
+
+GAME_SECTION_PATTERN = re.compile(r'^\s*### (game\d):', re.MULTILINE)
+
+def fake_analysis(prompt):
+    """통합 프롬프트면 {gameN: {...}}, 게임별 프롬프트면 {"notable_points": ...} 형태로 응답합니다."""
+    notable_points = "This is a fake analysis.\nIt was generated locally.\nNo Gemini request was made."
+    game_keys = GAME_SECTION_PATTERN.findall(prompt)
+    if game_keys:
+        return {game_key: {"notable_points": notable_points} for game_key in game_keys}
+    return {"notable_points": notable_points}
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stand-in for the Gemini generateContent REST API. '
+        'Point the app at it with GEMINI_API_ENDPOINT=http://127.0.0.1:<port> (and any GEMINI_API_KEY).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds to sleep before each response.')
+
+    def handle(self, *args, **options):
+        def build_response(path, body):
+            prompt = "".join(part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', []))
+            return {
+                "candidates": [{
+                    "content": {"role": "model", "parts": [{"text": json.dumps(fake_analysis(prompt))}]},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }],
+                "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": 30},
+            }, f"{path} ({len(prompt)} chars)"
+
+        serve_fake_api(self, 'Gemini', options['port'], ':generateContent', build_response, options['latency'])
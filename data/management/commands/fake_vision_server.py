@@ -0,0 +1,42 @@
+# data/management/commands/fake_vision_server.py
+
+from django.core.management.base import BaseCommand
+
+from data.emotion_utils import EMOTION_LIKELIHOOD_FIELDS
+from data.management.fake_server import serve_fake_api
+
+def _camel(field):
+    head, *rest = field.split('_')
+    return head + ''.join(word.title() for word in rest)
+
+def fake_face_annotation(emotion):
+    """emotion 에 해당하는 likelihood 만 VERY_LIKELY, 나머지는 VERY_UNLIKELY 인 얼굴 하나"""
+    return {
+        _camel(field): 'VERY_LIKELY' if target == emotion else 'VERY_UNLIKELY'
+        for target, field in EMOTION_LIKELIHOOD_FIELDS.items()
+    }
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stand-in for the Vision images:annotate REST API (face_detection and batch_annotate_images). '
+        'Point the app at it with VISION_API_ENDPOINT=http://127.0.0.1:<port>.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--emotion', default='happy', choices=list(EMOTION_LIKELIHOOD_FIELDS), help='Emotion every detected face shows.')
+        parser.add_argument('--no-face-every', type=int, default=0, help='Report no face for every Nth image (0 = never).')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds to sleep before each response (per request, not per image).')
+
+    def handle(self, *args, **options):
+        state = {'images': 0}
+
+        def build_response(path, body):
+            responses = []
+            for _ in body.get('requests', []):
+                state['images'] += 1
+                no_face = options['no_face_every'] and state['images'] % options['no_face_every'] == 0
+                responses.append({} if no_face else {'faceAnnotations': [fake_face_annotation(options['emotion'])]})
+            return {'responses': responses}, f"{len(responses)} image(s), {state['images']} total"
+
+        serve_fake_api(self, 'Vision', options['port'], '/images:annotate', build_response, options['latency'])
@@ -0,0 +1,115 @@
+# data/management/commands/run_nightly_analysis.py
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, Q, OuterRef, Subquery
+from django.utils import timezone
+
+from games.models import GameDailyStat, to_local_date
+from users.models import User
+from data.cache_utils import release_lock
+from data.tasks import _analysis_job_key
+from data.views import AnalyzeAllGameStatsView, _get_stat_buckets_for_users, _build_user_stats
+
+class RateLimiter:
+    """스레드 간에 공유되는 분당 요청 수 제한. wait() 호출 간격을 60/rpm 초 이상으로 벌립니다."""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_for = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+def users_needing_analysis():
+    """
+    마지막 AI 분석(확인) 이후 게임 데이터가 바뀐 사용자 id (오름차순).
+    로그/세션이 들어올 때마다 GameDailyStat.updated_at 이 갱신되므로, 게임마다 그 게임 롤업의 마지막 updated_at 을 gameN_checked_at 과 비교합니다.
+    통계가 같아 분석을 건너뛴 게임도 checked_at 이 갱신되어 빠지므로, 중간에 멈춰도 다시 실행하면 남은 사용자부터 이어서 처리됩니다.
+    """
+    last_updates, stale = {}, Q()
+    for game_id, game_key in enumerate(['game1', 'game2', 'game3'], start=1):
+        last_update = f'{game_key}_last_update'
+        last_updates[last_update] = Subquery(
+            GameDailyStat.objects.filter(user_id=OuterRef('user_id'), game_id=game_id).order_by('-updated_at').values('updated_at')[:1]
+        )
+        # 플레이한 적 없는 게임(last_update 없음)은 분석 대상이 아닙니다.
+        stale |= Q(**{f'{last_update}__isnull': False}) & (
+            Q(**{f'{game_key}_checked_at__isnull': True}) | Q(**{f'{game_key}_checked_at__lt': F(last_update)})
+        )
+    return (
+        User.objects
+        .annotate(**last_updates)
+        .filter(stale)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+    )
+
+class Command(BaseCommand):
+    help = (
+        'Runs the combined AI analysis for every user whose game data changed since their last analysis, '
+        'so dashboards only read stored results. Scheduled nightly by Celery beat (data.tasks.run_nightly_analysis).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Analyze only this user (repeatable).')
+        parser.add_argument('--limit', type=int, help='Process at most this many users.')
+        parser.add_argument('--concurrency', type=int, default=settings.AI_ANALYSIS_NIGHTLY_CONCURRENCY, help='Number of parallel Gemini requests.')
+        parser.add_argument('--rpm', type=int, default=settings.AI_ANALYSIS_NIGHTLY_RPM, help='Maximum Gemini requests per minute (0 = unlimited).')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Users whose stats are computed with one rollup query.')
+        parser.add_argument('--force', action='store_true', help='Re-analyze even when the stats are unchanged.')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or list(users_needing_analysis())
+        if options['limit']:
+            user_ids = user_ids[:options['limit']]
+        self.stdout.write(f"AI 분석 대상 사용자: {len(user_ids)}명")
+
+        rate_limiter = RateLimiter(options['rpm'])
+        view = AnalyzeAllGameStatsView()
+        today = to_local_date()
+        counts = {'analyzed': 0, 'skipped': 0, 'busy': 0, 'failed': 0}
+
+        def analyze(user_id, stats, checked_at):
+            # 같은 사용자의 analyze-all 요청이 Celery 에서 실행 중이면 건너뜁니다.
+            lock_key, token = _analysis_job_key(user_id, view.game_key), uuid.uuid4().hex
+            if not cache.add(lock_key, token, timeout=settings.AI_ANALYSIS_JOB_LOCK_TIMEOUT):
+                return 'busy'
+            try:
+                return 'analyzed' if view.run_analysis(user_id, force=options['force'], stats=stats, rate_limiter=rate_limiter, checked_at=checked_at) else 'skipped'
+            finally:
+                release_lock(lock_key, token)
+                connections.close_all()  # 워커 스레드마다 열린 DB 연결 정리
+
+        chunk_size = options['chunk_size']
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for start in range(0, len(user_ids), chunk_size):
+                chunk = user_ids[start:start + chunk_size]
+                checked_at = timezone.now()
+                buckets_by_user = _get_stat_buckets_for_users(chunk)
+                futures = {
+                    executor.submit(analyze, user_id, _build_user_stats(buckets_by_user[user_id], today), checked_at): user_id
+                    for user_id in chunk if user_id in buckets_by_user
+                }
+                for future in as_completed(futures):
+                    try:
+                        counts[future.result()] += 1
+                    except Exception as e:
+                        counts['failed'] += 1
+                        self.stderr.write(f"User ID {futures[future]} 분석 실패: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"AI 분석 완료: 분석 {counts['analyzed']}명, 변경 없음 {counts['skipped']}명, 실행 중 {counts['busy']}명, 실패 {counts['failed']}명"
+        ))
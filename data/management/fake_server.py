@@ -0,0 +1,49 @@
+# data/management/fake_server.py
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def serve_fake_api(command, name, port, path_suffix, build_response, latency=0.0):
+    """
+    fake_*_server 명령이 함께 쓰는 로컬 JSON POST 서버. 종료(Ctrl+C)할 때까지 실행합니다.
+    - path_suffix: 이 문자열로 끝나는 경로만 받고 나머지는 404
+    - build_response(path, body): 요청 JSON 으로 (응답 dict, 로그 한 줄)을 반환합니다. 요청 사이에 lock 으로 직렬화되므로 상태를 바꿔도 됩니다.
+    - latency: 응답 전에 쉬는 초 (요청마다)
+    """
+    stdout = command.stdout
+    lock = threading.Lock()
+    state = {'requests': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.split('?')[0].endswith(path_suffix):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with lock:
+                state['requests'] += 1
+                count = state['requests']
+                response, summary = build_response(self.path, body)
+            time.sleep(latency)
+
+            payload = json.dumps(response).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            stdout.write(f"[{count}] {summary}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    stdout.write(command.style.SUCCESS(f"Fake {name} server listening on http://127.0.0.1:{port}"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,17 @@
+# data/parsers.py
+
+from rest_framework.parsers import BaseParser
+
+class RawImageParser(BaseParser):
+    """
+    application/octet-stream 본문(이미지 바이트)을 base64/JSON 변환 없이 그대로 request.data 로 넘깁니다.
+    나머지 값(target_emotion 등)은 쿼리 파라미터로 받습니다.
+    """
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read() if stream is not None else b''
+
+class ImageBodyParser(RawImageParser):
+    """Content-Type: image/jpeg, image/png 등으로 보낸 이미지 바이트"""
+    media_type = 'image/*'
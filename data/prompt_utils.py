@@ -0,0 +1,71 @@
+# data/prompt_utils.py
+
+import json
+import math
+from datetime import date, timedelta
+from django.conf import settings
+
+class DateEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+def prompt_json(data):
+    """들여쓰기/공백 없이 직렬화합니다. (indent=4 대비 토큰 수가 크게 줄어듭니다)"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), cls=DateEncoder)
+
+def estimate_tokens(text):
+    """대략적인 토큰 수 (영문/JSON 기준 약 4글자당 1토큰)"""
+    return math.ceil(len(text) / 4)
+
+def _mean(values):
+    return round(sum(values) / len(values), 2)
+
+def compact_trend(points, recent_days, max_weeks):
+    """
+    [{'date', 'value'}] 추이를 고정된 크기로 줄입니다.
+    - 최근 recent_days 개 포인트는 그대로 유지
+    - 그 이전은 주(월요일 시작) 단위 평균으로 묶고, 최근 max_weeks 주만 유지
+    - 그보다 오래된 포인트는 하나의 평균으로 묶습니다.
+    """
+    points = sorted(points, key=lambda p: p['date'])
+    split = max(len(points) - recent_days, 0)
+    older, recent = points[:split], points[split:]
+
+    weeks = {}
+    for point in older:
+        weeks.setdefault(point['date'] - timedelta(days=point['date'].weekday()), []).append(point['value'])
+    week_starts = sorted(weeks)
+    kept_weeks = week_starts[len(week_starts) - max_weeks:] if max_weeks else []
+
+    compacted = []
+    dropped = [value for week in week_starts[:len(week_starts) - len(kept_weeks)] for value in weeks[week]]
+    if dropped:
+        compacted.append({'before': kept_weeks[0] if kept_weeks else recent[0]['date'], 'days': len(dropped), 'value': _mean(dropped)})
+    compacted += [{'week': week, 'days': len(weeks[week]), 'value': _mean(weeks[week])} for week in kept_weeks]
+    compacted += [{'date': point['date'], 'value': round(point['value'], 2)} for point in recent]
+    return compacted
+
+def compact_game_data(game_data, recent_days, max_weeks):
+    """*_trend 리스트만 줄이고, 오늘/전체 수치 등 나머지 값은 그대로 둡니다."""
+    return {
+        key: compact_trend(value, recent_days, max_weeks) if key.endswith('_trend') and isinstance(value, list) else value
+        for key, value in game_data.items()
+    }
+
+def fit_prompt(render, budget):
+    """
+    render(recent_days, max_weeks) 로 프롬프트를 만들고, 예상 토큰 수가 budget 을 넘으면 추이를 더 줄여 다시 만듭니다.
+    사용 기간과 관계없이 프롬프트 크기(= Gemini 지연 시간/비용)가 거의 일정하게 유지됩니다.
+    """
+    recent_days, max_weeks = settings.AI_ANALYSIS_TREND_RECENT_DAYS, settings.AI_ANALYSIS_TREND_MAX_WEEKS
+    while True:
+        prompt = render(recent_days, max_weeks)
+        tokens = estimate_tokens(prompt)
+        if tokens <= budget or (recent_days <= 1 and max_weeks == 0):
+            break
+        recent_days, max_weeks = max(recent_days // 2, 1), max_weeks // 2
+    if tokens > budget:
+        print(f"AI analysis prompt is still over budget after compaction: ~{tokens} tokens (budget {budget}).")
+    return prompt
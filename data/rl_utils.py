@@ -1,42 +1,45 @@
 # data/rl_utils.py
 
-from games.models import GameSession, GameInteractionLog
+from django.db.models import Count, Sum, Case, When
+from games.models import GameInteractionLog, GameDailyStat
 
-def get_user_state(user_id, game_type=3):
+def get_user_state(user_id, game_type=3, window=20):
     """ 사용자의 현재 '상태' (최근 평균 throw_power)를 계산합니다. """
-    # 해당 유저의 3번 게임 세션 ID들을 모두 가져옵니다.
-    user_sessions = GameSession.objects.filter(
-        user_id=user_id, 
-        game_id=game_type
-    ).values_list('session_id', flat=True)
-    
-    # 해당 세션들에 속한 로그들을 최신 20개 가져옵니다.
-    # [수정] session__session_id__in -> session_id__in 으로 쿼리 변경
-    logs = GameInteractionLog.objects.filter(session_id__in=list(user_sessions)).order_by('-timestamp')[:20]
-
-    if not logs:
-        return 50.0  # 기록이 없으면 중간값 50으로 시작
-
-    total_power = sum(log.interaction_data.get('throw_power', 0) for log in logs)
-    count = sum(1 for log in logs if 'throw_power' in log.interaction_data)
-    
-    return total_power / count if count > 0 else 50.0
+    # 원본 로그 대신 일일 롤업을 최신 날짜부터 읽어, throw_power 기록이 window개 이상 모일 때까지 합산합니다.
+    # 각 행은 최소 1개의 기록을 가지므로 window개 행이면 충분합니다.
+    rows = GameDailyStat.objects.filter(
+        user_id=user_id,
+        game_id=game_type,
+        throw_power_count__gt=0
+    ).order_by('-local_date').values_list('throw_power_sum', 'throw_power_count')[:window]
+
+    total_power, count = 0, 0
+    for power_sum, power_count in rows:
+        total_power += power_sum
+        count += power_count
+        if count >= window:
+            break
+
+    return total_power / count if count > 0 else 50.0  # 기록이 없으면 중간값 50으로 시작
 
 def calculate_reward_and_next_state(session_id):
     """ 한 게임 세션의 '보상'과 '다음 상태'를 계산합니다. """
-    logs = GameInteractionLog.objects.filter(session_id=session_id)
-    total_throws = logs.count()
+    # 던진 횟수, 성공 횟수, throw_power 합계를 한 번의 집계 쿼리로 가져옵니다.
+    result = GameInteractionLog.objects.filter(session_id=session_id).aggregate(
+        total_throws=Count('log_id'),
+        successful_throws=Count(Case(When(is_successful=True, then=1))),
+        total_power=Sum('throw_power'),
+    )
+    total_throws = result['total_throws']
 
     if total_throws == 0:
         return None, None
 
     # 보상 계산
-    successful_throws = logs.filter(is_successful=True).count()
-    success_rate = successful_throws / total_throws
+    success_rate = result['successful_throws'] / total_throws
     reward = 1.0 if success_rate >= 0.5 else -1.0
 
     # 다음 상태(next_state) 계산
-    total_power = sum(log.interaction_data.get('throw_power', 0) for log in logs)
-    next_state = total_power / total_throws
+    next_state = (result['total_power'] or 0) / total_throws
 
-    return reward, next_state
\ No newline at end of file
+    return reward, next_state
@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.utils import timezone
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import serializers
 from .models import ChecklistResult
 
@@ -67,6 +71,43 @@ class ComprehensiveStatsSerializer(serializers.Serializer):
 class StatsRequestSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
 
+class ComprehensiveStatsRequestSerializer(StatsRequestSerializer):
+    """
+    since 를 주면 그 이후 바뀐 날짜의 추이 데이터만 반환합니다.
+    - 날짜(YYYY-MM-DD): 해당 날짜 이후의 추이 포인트
+    - 커서(이전 응답의 cursor, ISO datetime): 그 시각 이후 갱신된 날짜의 추이 포인트
+    """
+    since = serializers.CharField(required=False)
+
+    def validate_since(self, value):
+        # parse_datetime 은 날짜만 있는 값도 자정 datetime 으로 읽으므로 날짜를 먼저 확인합니다.
+        parsed = parse_date(value)
+        if parsed is not None:
+            return parsed
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+        raise serializers.ValidationError("since must be a date (YYYY-MM-DD) or a cursor returned by a previous response.")
+
+class AnalyzeGameStatsRequestSerializer(StatsRequestSerializer):
+    """force=true 이면 통계가 바뀌지 않았어도 Gemini 로 다시 분석합니다."""
+    force = serializers.BooleanField(required=False, default=False)
+
+class AnalysisJobStatusRequestSerializer(serializers.Serializer):
+    """AI 분석 작업 상태 조회용 Serializer (job_id 또는 user_id + game_key 중 하나 필요)"""
+    job_id = serializers.CharField(required=False)
+    user_id = serializers.IntegerField(required=False)
+    game_key = serializers.ChoiceField(choices=['game1', 'game2', 'game3', 'all'], required=False)
+
+    def validate(self, data):
+        if not data.get('job_id') and not (data.get('user_id') and data.get('game_key')):
+            raise serializers.ValidationError("Either job_id or both user_id and game_key are required.")
+        return data
+
+class CohortStatsRequestSerializer(serializers.Serializer):
+    """여러 아동의 통계를 한 번에 요청하기 위한 Serializer"""
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=settings.COHORT_STATS_MAX_USERS)
+
 # --- 체크리스트 관련 Serializer (기존 유지) ---
 class ChecklistResultSerializer(serializers.ModelSerializer):
     class Meta:
@@ -77,14 +118,44 @@ class ChecklistResultSerializer(serializers.ModelSerializer):
 class HistoryRequestSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
 
+class ImageDataField(serializers.Field):
+    """base64 data URL 문자열(JSON) 또는 업로드 파일(multipart/form-data)을 그대로 받습니다."""
+    default_error_messages = {'invalid': 'Expected a base64 data URL string or an uploaded file.'}
+
+    def to_internal_value(self, data):
+        if isinstance(data, (str, UploadedFile)):
+            return data
+        self.fail('invalid')
+
+    def to_representation(self, value):
+        return None
+
 class DetectEmotionSerializer(serializers.Serializer):
-    """DetectEmotionView를 위한 Serializer"""
-    image = serializers.CharField()
+    """
+    DetectEmotionView를 위한 Serializer
+    - JSON: image 에 base64 data URL
+    - multipart/form-data: image 에 파일
+    - application/octet-stream, image/*: 본문이 이미지, 나머지 필드는 쿼리 파라미터 (context['raw_image']=True)
+    """
+    image = ImageDataField(required=False)
     target_emotion = serializers.CharField()
     
     # --- MODIFICATION: response_time_ms 필드 추가 ---
     # 반응 시간(ms)을 입력받으며, 0 이상의 정수여야 합니다.
     response_time_ms = serializers.IntegerField(min_value=0)
+    # 선택: 게임 세션 id. 주면 비슷한 프레임 결과 캐시를 같은 세션 안에서만 공유합니다.
+    session_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if not self.context.get('raw_image') and 'image' not in data:
+            raise serializers.ValidationError({'image': 'This field is required.'})
+        return data
+
+class DetectEmotionBatchSerializer(serializers.Serializer):
+    """DetectEmotionBatchView를 위한 Serializer (JSON: base64 data URL 목록, multipart: images 파일 여러 개)"""
+    images = serializers.ListField(child=ImageDataField(), min_length=1, max_length=settings.EMOTION_BATCH_MAX_FRAMES)
+    target_emotion = serializers.CharField()
+    session_id = serializers.IntegerField(required=False)
 
 class UserStatsWithAnalysisSerializer(serializers.Serializer):
     """사용자 통계와 AI 분석 결과를 함께 반환하기 위한 Serializer"""
@@ -0,0 +1,64 @@
+# data/tasks.py
+
+import uuid
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from .cache_utils import is_cache_shared, release_lock
+
+def _analysis_job_key(user_id, game_key):
+    return f'ai-analysis-job:{user_id}:{game_key}'
+
+def get_analysis_job_id(user_id, game_key):
+    """(user, game) 에 대해 대기/실행 중인 분석 작업 id. 없으면 None."""
+    return cache.get(_analysis_job_key(user_id, game_key))
+
+def enqueue_game_analysis(user_id, game_key, force=False):
+    """
+    AI 분석 작업을 Celery 큐에 넣습니다.
+    (user, game) 당 하나의 작업만 대기/실행되도록, 이미 있으면 새로 넣지 않고 기존 작업 id 를 돌려줍니다.
+    반환값: (job_id, created)
+    """
+    if not is_cache_shared():
+        # 잠금을 워커가 지우지 못해 AI_ANALYSIS_JOB_LOCK_TIMEOUT 동안 재요청이 막히고, 워커는 오래된 통계 캐시를 읽게 됩니다.
+        raise ImproperlyConfigured("AI analysis jobs need a cache shared with the Celery workers. Set REDIS_CACHE_URL.")
+    job_id = uuid.uuid4().hex
+    if not cache.add(_analysis_job_key(user_id, game_key), job_id, timeout=settings.AI_ANALYSIS_JOB_LOCK_TIMEOUT):
+        return get_analysis_job_id(user_id, game_key), False
+    try:
+        run_game_analysis.apply_async(args=(user_id, game_key, force), task_id=job_id)
+    except Exception:
+        # 큐에 넣지 못한 작업의 잠금이 남으면 잠금 시간 동안 모든 요청이 '실행 중'을 받습니다.
+        release_lock(_analysis_job_key(user_id, game_key), job_id)
+        raise
+    return job_id, True
+
+@shared_task(
+    bind=True,
+    acks_late=True,  # 워커가 재시작되어도 완료 전 작업은 다시 전달됩니다.
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=5,
+)
+def run_game_analysis(self, user_id, game_key, force=False):
+    """Gemini 로 게임 통계를 분석해 User.gameN_analysis 에 저장하는 Celery Task (game_key='all' 이면 세 게임을 한 번에)"""
+    from .views import ANALYSIS_VIEWS  # views 가 이 모듈을 import 하므로 순환 import 를 피합니다.
+
+    try:
+        ANALYSIS_VIEWS[game_key]().run_analysis(user_id, force=force)
+    except Exception:
+        if self.request.retries >= self.max_retries:
+            release_lock(_analysis_job_key(user_id, game_key), self.request.id)
+        raise
+    release_lock(_analysis_job_key(user_id, game_key), self.request.id)
+    return f"AI analysis for {game_key} for User ID {user_id} completed"
+
+@shared_task
+def run_nightly_analysis():
+    """Celery beat 로 매일 밤 실행되어, 데이터가 바뀐 사용자의 AI 분석을 미리 만들어 둡니다."""
+    call_command('run_nightly_analysis')
@@ -1,3 +1,536 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import struct
+import zlib
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Avg, Count, Sum, F, Case, When, DurationField
+from django.db.models.functions import TruncDate
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
 
-# Create your tests here.
+from games.models import GameDailyStat, GameSession, GameInteractionLog
+from games.tests import LOCMEM_CACHES, GamePlayMixin
+from .consumers import emotion_socket
+from .emotion_utils import EMOTION_LIKELIHOOD_FIELDS, detect_face_likelihoods
+from .management.commands.fake_gemini_server import fake_analysis
+from .prompt_utils import compact_game_data, compact_trend, estimate_tokens, fit_prompt, prompt_json
+from .management.commands.run_nightly_analysis import users_needing_analysis
+from .tasks import _analysis_job_key, enqueue_game_analysis, get_analysis_job_id, run_game_analysis
+from .views import AnalyzeAllGameStatsView, _generate_comprehensive_stats, _default_stats
+
+ASSISTANCE_LEVELS = ['NONE', 'VERBAL', 'PHYSICAL']
+
+def _legacy_comprehensive_stats(user_id):
+    """
+    롤업 도입 전 _generate_comprehensive_stats 를 그대로 옮긴 기준 구현. (원본 세션/로그를 직접 집계)
+    날짜별 추이는 정렬되지 않은 채 반환되던 것만 날짜순으로 정렬합니다.
+    """
+    today = timezone.now().date()
+    sessions = GameSession.objects.filter(user_id=user_id)
+    if not sessions.exists():
+        return _default_stats()
+    session_assistance_map = {s.session_id: s.assistance_level for s in sessions}
+    logs = GameInteractionLog.objects.filter(session_id__in=sessions.values_list('session_id', flat=True))
+
+    def session_logs(game_sessions):
+        return logs.filter(session_id__in=game_sessions.values_list('session_id', flat=True))
+
+    def play_seconds(game_sessions):
+        total = game_sessions.aggregate(total=Sum(F('session_end_time') - F('session_start_time'), output_field=DurationField()))['total']
+        return total.total_seconds() if total else 0
+
+    def success_rate_trend(game_logs):
+        return list(game_logs.annotate(date=TruncDate('timestamp')).values('date').annotate(s=Count(Case(When(is_successful=True, then=1))), t=Count('log_id')).annotate(value=F('s') * 100.0 / F('t')).values('date', 'value').order_by('date'))
+
+    def response_time_trend(game_logs):
+        return list(game_logs.filter(response_time_ms__isnull=False).annotate(date=TruncDate('timestamp')).values('date').annotate(value=Avg('response_time_ms')).values('date', 'value').order_by('date'))
+
+    def success_rate(game_logs):
+        return (game_logs.filter(is_successful=True).count() / game_logs.count() * 100) if game_logs.count() > 0 else 0
+
+    def success_rate_by_assistance(game_logs):
+        success, total = defaultdict(int), defaultdict(int)
+        for log in game_logs:
+            level = session_assistance_map.get(log.session_id)
+            if level:
+                total[level] += 1
+                if log.is_successful: success[level] += 1
+        return {level: (success[level] / total[level] * 100) if total[level] > 0 else 0 for level in ASSISTANCE_LEVELS}
+
+    g1_sessions = sessions.filter(game_id=1)
+    g1_logs = session_logs(g1_sessions)
+    g1_today_logs = g1_logs.filter(timestamp__date=today)
+    game1 = {
+        'today_attempts': g1_today_logs.count(),
+        'today_success_rate': success_rate(g1_today_logs),
+        'today_play_duration_seconds': play_seconds(g1_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)),
+        'overall_avg_success_rate': success_rate(g1_logs),
+        'overall_avg_response_time': g1_logs.aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
+        'daily_success_rate_trend': success_rate_trend(g1_logs),
+        'daily_response_time_trend': response_time_trend(g1_logs),
+        'success_rate_by_assistance': success_rate_by_assistance(g1_logs),
+    }
+
+    g2_sessions = sessions.filter(game_id=2)
+    g2_logs = session_logs(g2_sessions)
+    g2_today_sessions = g2_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)
+    total_play_seconds = play_seconds(g2_sessions.exclude(session_end_time__isnull=True))
+    total_play_days = g2_sessions.annotate(date=TruncDate('session_start_time')).values('date').distinct().count()
+    daily_play_time = g2_sessions.exclude(session_end_time__isnull=True).annotate(date=TruncDate('session_start_time')).values('date').annotate(total_duration=Sum(F('session_end_time') - F('session_start_time'))).order_by('date')
+    game2 = {
+        'today_play_count': g2_today_sessions.count(),
+        'today_play_duration_seconds': play_seconds(g2_today_sessions),
+        'today_avg_response_time': g2_logs.filter(timestamp__date=today).aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
+        'overall_avg_response_time': g2_logs.aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
+        'avg_daily_play_time_seconds': (total_play_seconds / total_play_days) if total_play_days > 0 and total_play_seconds else 0,
+        'daily_response_time_trend': response_time_trend(g2_logs),
+        'daily_play_time_trend': [{'date': entry['date'], 'value': entry['total_duration'].total_seconds() if entry['total_duration'] else 0} for entry in daily_play_time],
+        'play_time_by_assistance': {level: play_seconds(g2_sessions.filter(assistance_level=level, session_end_time__isnull=False)) for level in ASSISTANCE_LEVELS},
+    }
+
+    g3_sessions = sessions.filter(game_id=3)
+    g3_logs = session_logs(g3_sessions)
+    g3_today_logs = g3_logs.filter(timestamp__date=today)
+    daily_power, assistance_power = defaultdict(lambda: {'total': 0, 'count': 0}), defaultdict(lambda: {'total': 0, 'count': 0})
+    for log in g3_logs:
+        power = log.interaction_data.get('throw_power')
+        if power is None:
+            continue
+        daily_power[log.timestamp.date()]['total'] += power
+        daily_power[log.timestamp.date()]['count'] += 1
+        level = session_assistance_map.get(log.session_id)
+        if level:
+            assistance_power[level]['total'] += power
+            assistance_power[level]['count'] += 1
+    game3 = {
+        'today_attempts': g3_today_logs.count(),
+        'today_success_rate': success_rate(g3_today_logs),
+        'today_play_duration_seconds': play_seconds(g3_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)),
+        'overall_avg_success_rate': success_rate(g3_logs),
+        'daily_success_rate_trend': success_rate_trend(g3_logs),
+        'daily_avg_power_trend': [{'date': date, 'value': data['total'] / data['count']} for date, data in sorted(daily_power.items())],
+        'success_rate_by_assistance': success_rate_by_assistance(g3_logs),
+        'avg_power_by_assistance': {level: data['total'] / data['count'] for level, data in assistance_power.items()},
+    }
+    return {'game1': game1, 'game2': game2, 'game3': game3}
+
+def _as_json(stats):
+    """JSON 으로 직렬화한 뒤 숫자를 소수점 6자리로 맞춥니다. (SQL AVG 와 합계/개수 나눗셈의 반올림 차이 무시)"""
+    def normalize(value):
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return round(float(value), 6)
+        return value
+    return normalize(json.loads(json.dumps(stats, cls=DjangoJSONEncoder)))
+
+@override_settings(CACHES=LOCMEM_CACHES, STATS_TIME_ZONE='UTC')
+class ComprehensiveStatsTests(GamePlayMixin, TestCase):
+    """롤업에서 만든 통계가 롤업 도입 전(원본 로그 집계)과 같은 JSON 인지 확인합니다. 기존 구현의 날짜 기준인 UTC 로 비교합니다."""
+
+    def assertStatsMatchLegacy(self):
+        self.assertEqual(_as_json(_generate_comprehensive_stats(self.user.user_id)), _as_json(_legacy_comprehensive_stats(self.user.user_id)))
+
+    def test_no_data_returns_default_stats(self):
+        self.assertEqual(_generate_comprehensive_stats(self.user.user_id), _default_stats())
+        self.assertStatsMatchLegacy()
+
+    def test_sample_games(self):
+        self.play_sample_games()
+        self.assertStatsMatchLegacy()
+
+    def test_open_session_only(self):
+        session_id = self.start(2)
+        self.log(session_id, True, response_time_ms=640)
+        self.log(session_id, False, response_time_ms=1310, days_ago=1)
+        self.assertStatsMatchLegacy()
+
+@override_settings(CACHES=LOCMEM_CACHES, STATS_TIME_ZONE='UTC')
+class ComprehensiveStatsDeltaTests(GamePlayMixin, TestCase):
+    """since 가 날짜면 그 날짜 이후 포인트만, 커서면 그 시각 이후 롤업이 갱신된 (게임, 날짜) 포인트만 반환합니다."""
+
+    def stats(self, **data):
+        response = self.client.post('/api/data/user-stats/', {'user_id': self.user.user_id, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def trend_dates(self, data, game_key, field):
+        return [point['date'] for point in data['statistics'][game_key][field]]
+
+    def test_date_since_keeps_points_from_that_date(self):
+        self.play_sample_games()
+        today = timezone.now().date()
+        yesterday = (today - timedelta(days=1)).isoformat()
+        self.assertEqual(self.trend_dates(self.stats(), 'game3', 'daily_success_rate_trend'), [(today - timedelta(days=2)).isoformat(), today.isoformat()])
+
+        # 오래전에 갱신된 롤업이어도 날짜 기준으로만 거릅니다.
+        GameDailyStat.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        data = self.stats(since=yesterday)
+        self.assertTrue(data['is_delta'])
+        self.assertEqual(self.trend_dates(data, 'game3', 'daily_success_rate_trend'), [today.isoformat()])
+        self.assertEqual(self.trend_dates(data, 'game2', 'daily_response_time_trend'), [yesterday, today.isoformat()])
+        self.assertEqual(data['statistics']['game3']['overall_avg_success_rate'], self.stats()['statistics']['game3']['overall_avg_success_rate'])
+
+    def test_cursor_since_keeps_points_updated_after_it(self):
+        self.play_sample_games()
+        GameDailyStat.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        cursor = self.stats()['cursor']
+        self.assertEqual(self.trend_dates(self.stats(since=cursor), 'game1', 'daily_success_rate_trend'), [])
+
+        self.log(self.start(1), True, response_time_ms=700)
+        data = self.stats(since=cursor)
+        self.assertEqual(self.trend_dates(data, 'game1', 'daily_success_rate_trend'), [timezone.now().date().isoformat()])
+        self.assertEqual(self.trend_dates(data, 'game3', 'daily_success_rate_trend'), [])
+
+    def test_invalid_since(self):
+        response = self.client.post('/api/data/user-stats/', {'user_id': self.user.user_id, 'since': 'yesterday'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+def _daily_points(start, days):
+    return [{'date': start + timedelta(days=index), 'value': float(index)} for index in range(days)]
+
+class PromptCompactionTests(SimpleTestCase):
+    """프롬프트 추이 압축: 최근 포인트/주 단위 평균/이전 평균으로 줄이고 오늘/전체 수치는 그대로 둡니다."""
+
+    def test_weekly_and_before_buckets_start_on_monday(self):
+        # 2025-01-01 은 수요일이므로 첫 주는 2024-12-30(월) 주입니다.
+        points = list(reversed(_daily_points(date(2025, 1, 1), 30)))
+        compacted = compact_trend(points, recent_days=7, max_weeks=2)
+        self.assertEqual(compacted[:3], [
+            {'before': date(2025, 1, 13), 'days': 12, 'value': 5.5},
+            {'week': date(2025, 1, 13), 'days': 7, 'value': 15.0},
+            {'week': date(2025, 1, 20), 'days': 4, 'value': 20.5},
+        ])
+        self.assertEqual(compacted[3:], [{'date': date(2025, 1, 24) + timedelta(days=index), 'value': 23.0 + index} for index in range(7)])
+
+    def test_short_trend_is_unchanged(self):
+        points = _daily_points(date(2025, 1, 1), 5)
+        self.assertEqual(compact_trend(points, recent_days=7, max_weeks=2), points)
+
+    def test_scalar_fields_pass_through(self):
+        game_data = {
+            'today_attempts': 7,
+            'overall_avg_success_rate': 66.666667,
+            'success_rate_by_assistance': {'NONE': 50.0, 'VERBAL': 0, 'PHYSICAL': 100.0},
+            'daily_success_rate_trend': _daily_points(date(2025, 1, 1), 60),
+        }
+        compacted = compact_game_data(game_data, recent_days=7, max_weeks=2)
+        self.assertEqual({key: value for key, value in compacted.items() if not key.endswith('_trend')}, {key: value for key, value in game_data.items() if not key.endswith('_trend')})
+        self.assertEqual(len(compacted['daily_success_rate_trend']), 1 + 2 + 7)
+
+    @override_settings(AI_ANALYSIS_TREND_RECENT_DAYS=14, AI_ANALYSIS_TREND_MAX_WEEKS=8)
+    def test_fit_prompt_halves_until_under_budget(self):
+        game_data = {'overall_avg_success_rate': 66.666667, 'daily_success_rate_trend': _daily_points(date(2024, 1, 1), 365)}
+        calls = []
+
+        def render(recent_days, max_weeks):
+            calls.append((recent_days, max_weeks))
+            return prompt_json(compact_game_data(game_data, recent_days, max_weeks))
+
+        full = estimate_tokens(render(14, 8))
+        calls.clear()
+        prompt = fit_prompt(render, budget=full // 2)
+        self.assertLessEqual(estimate_tokens(prompt), full // 2)
+        self.assertEqual(calls[:2], [(14, 8), (7, 4)])
+        self.assertIn('"overall_avg_success_rate":66.666667', prompt)
+
+    @override_settings(AI_ANALYSIS_TREND_RECENT_DAYS=14, AI_ANALYSIS_TREND_MAX_WEEKS=8)
+    def test_fit_prompt_stops_at_smallest_trend(self):
+        calls = []
+
+        def render(recent_days, max_weeks):
+            calls.append((recent_days, max_weeks))
+            return 'x' * 400
+
+        fit_prompt(render, budget=10)
+        self.assertEqual(calls, [(14, 8), (7, 4), (3, 2), (1, 1), (1, 0)])
+
+class FakeGemini:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text=json.dumps(fake_analysis(prompt)))
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NightlyAnalysisTests(GamePlayMixin, TestCase):
+    """야간 분석 대상 선정: 분석(또는 확인)이 끝난 사용자는 빠지고, 그 게임의 데이터가 바뀌면 다시 대상이 됩니다."""
+
+    def setUp(self):
+        super().setUp()
+        self.gemini = FakeGemini()
+        patcher = mock.patch('data.views.get_client', return_value=self.gemini)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_nightly(self):
+        return AnalyzeAllGameStatsView().run_analysis(self.user.user_id)
+
+    def run_task(self, task_id, game_key='all'):
+        # apply() 는 결과 백엔드(Redis)에 기록하므로 작업 본문만 작업 id 와 함께 실행합니다.
+        run_game_analysis.push_request(id=task_id, retries=0)
+        try:
+            run_game_analysis.run(self.user.user_id, game_key)
+        finally:
+            run_game_analysis.pop_request()
+
+    def test_analysis_job_releases_only_its_own_lock(self):
+        key = _analysis_job_key(self.user.user_id, 'all')
+        cache.set(key, 'job-1')
+        self.run_task('job-1')
+        self.assertIsNone(cache.get(key))
+
+        # 잠금이 만료된 뒤 새 작업이 잠금을 잡았다면 이전 작업이 끝나도 남아 있어야 합니다.
+        cache.set(key, 'job-2')
+        self.run_task('job-1')
+        self.assertEqual(cache.get(key), 'job-2')
+
+    def test_analyzed_user_drops_out_until_its_game_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.play_sample_games()
+        self.assertEqual(list(users_needing_analysis()), [self.user.user_id])
+        self.assertEqual(self.run_nightly(), ['game1', 'game2', 'game3'])
+        self.assertEqual(list(users_needing_analysis()), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.log(self.start(1), True, response_time_ms=900)
+        self.assertEqual(list(users_needing_analysis()), [self.user.user_id])
+        self.assertEqual(self.run_nightly(), ['game1'])
+        self.assertEqual(list(users_needing_analysis()), [])
+        self.assertEqual(len(self.gemini.prompts), 2)
+
+    def test_unchanged_stats_are_checked_without_gemini(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.play_sample_games()
+        self.run_nightly()
+
+        # 로그 없는 세션은 롤업을 갱신하지만 3번 게임 통계(분석 프롬프트)는 바뀌지 않습니다.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.start(3)
+        self.assertEqual(list(users_needing_analysis()), [self.user.user_id])
+        self.assertEqual(self.run_nightly(), [])
+        self.assertEqual(list(users_needing_analysis()), [])
+        self.assertEqual(len(self.gemini.prompts), 1)
+
+    @mock.patch('data.tasks.is_cache_shared', return_value=True)
+    def test_failed_enqueue_releases_the_lock(self, is_cache_shared):
+        with mock.patch.object(run_game_analysis, 'apply_async', side_effect=ConnectionError('broker down')):
+            with self.assertRaises(ConnectionError):
+                enqueue_game_analysis(self.user.user_id, 'all')
+        self.assertIsNone(get_analysis_job_id(self.user.user_id, 'all'))
+
+    def test_nightly_run_keeps_a_lock_taken_by_another_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.play_sample_games()
+        key = _analysis_job_key(self.user.user_id, 'all')
+
+        def run_analysis(user_id, **kwargs):
+            # 분석 중에 잠금이 만료되고 Celery 의 analyze-all 작업이 새로 잡은 경우
+            cache.set(key, 'celery-job')
+            return ['game1']
+
+        with mock.patch.object(AnalyzeAllGameStatsView, 'run_analysis', side_effect=run_analysis):
+            call_command('run_nightly_analysis', concurrency=1, stdout=io.StringIO())
+        self.assertEqual(cache.get(key), 'celery-job')
+
+def _png_header(width, height):
+    """IHDR 만 있는 PNG. 파일은 수십 바이트지만 디코딩하면 width x height 픽셀입니다."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) + chunk(b'IEND', b'')
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DetectEmotionImageLimitTests(TestCase):
+    """픽셀 수가 너무 많은 이미지는 Vision 호출이나 디코딩 없이 413 으로 거절합니다."""
+
+    def test_raw_body_over_pixel_limit(self):
+        for width, height in [(5000, 5000), (20000, 20000)]:
+            response = self.client.post('/api/data/detect-emotion/?target_emotion=happy&response_time_ms=0', _png_header(width, height), content_type='image/png')
+            self.assertEqual(response.status_code, 413)
+
+    def test_batch_over_pixel_limit(self):
+        image = 'data:image/png;base64,' + base64.b64encode(_png_header(20000, 20000)).decode()
+        response = self.client.post('/api/data/detect-emotion/batch/', {'images': [image], 'target_emotion': 'happy'}, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+@override_settings(CACHES=LOCMEM_CACHES, EMOTION_CACHE_TTL=60)
+class EmotionCacheScopeTests(TestCase):
+    """감정 인식 캐시는 같은 게임 세션 안에서만 재사용하고, session_id 가 없으면 쓰지 않습니다."""
+
+    def setUp(self):
+        self.vision = mock.Mock()
+        self.vision.face_detection.return_value = SimpleNamespace(face_annotations=[])
+        patcher = mock.patch('data.emotion_utils.get_client', return_value=self.vision)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_session_reuses_result(self):
+        image = _jpeg('gray')
+        detect_face_likelihoods(image, 1)
+        detect_face_likelihoods(image, 1)
+        self.assertEqual(self.vision.face_detection.call_count, 1)
+        detect_face_likelihoods(image, 2)
+        self.assertEqual(self.vision.face_detection.call_count, 2)
+
+    def test_no_session_is_not_cached(self):
+        image = _jpeg('gray')
+        detect_face_likelihoods(image)
+        detect_face_likelihoods(image)
+        self.assertEqual(self.vision.face_detection.call_count, 2)
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmotionSocketTests(TestCase):
+    """한 프레임에서 예외가 나도 연결은 오류를 알리고 다음 프레임을 계속 처리합니다."""
+
+    def test_frame_error_keeps_the_loop_running(self):
+        vision = mock.Mock()
+        vision.face_detection.side_effect = [RuntimeError('Vision unavailable'), SimpleNamespace(face_annotations=[])]
+
+        async def run():
+            incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+            await incoming.put({'type': 'websocket.connect'})
+            socket = asyncio.create_task(emotion_socket({'query_string': b'target_emotion=happy'}, incoming.get, outgoing.put))
+            self.assertEqual((await outgoing.get())['type'], 'websocket.accept')
+            replies = []
+            for color in ['gray', 'white']:
+                await incoming.put({'type': 'websocket.receive', 'bytes': _jpeg(color)})
+                replies.append(json.loads((await asyncio.wait_for(outgoing.get(), 5))['text']))
+            await incoming.put({'type': 'websocket.disconnect'})
+            await socket
+            return replies
+
+        with mock.patch('data.emotion_utils.get_client', return_value=vision):
+            replies = asyncio.run(run())
+        self.assertEqual(replies, [
+            {'frame': 1, 'error': 'Emotion detection failed'},
+            {'frame': 2, 'error': 'No face detected'},
+        ])
+
+def _face(**likelihoods):
+    return SimpleNamespace(**{field: likelihoods.get(field, 1) for field in EMOTION_LIKELIHOOD_FIELDS.values()})
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DetectEmotionUploadTests(TestCase):
+    """이미지는 JSON(base64 data URL), multipart 파일, 이미지 바이트 본문(나머지 값은 쿼리 파라미터) 중 어느 것으로 보내도 같게 판정합니다."""
+
+    def setUp(self):
+        self.vision = mock.Mock()
+        self.vision.face_detection.return_value = SimpleNamespace(face_annotations=[_face(joy_likelihood=5)])
+        patcher = mock.patch('data.emotion_utils.get_client', return_value=self.vision)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMatch(self, response, is_match=True):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data, {'is_match': is_match})
+        # Vision 에는 전처리(JPEG 재인코딩)된 이미지가 전달됩니다.
+        self.assertTrue(self.vision.face_detection.call_args.kwargs['image'].content.startswith(b'\xff\xd8'))
+
+    def test_json_data_url(self):
+        image = 'data:image/jpeg;base64,' + base64.b64encode(_jpeg('gray')).decode()
+        response = self.client.post('/api/data/detect-emotion/', {'image': image, 'target_emotion': 'happy', 'response_time_ms': 300}, content_type='application/json')
+        self.assertMatch(response)
+        response = self.client.post('/api/data/detect-emotion/', {'image': image, 'target_emotion': 'sad', 'response_time_ms': 300}, content_type='application/json')
+        self.assertMatch(response, is_match=False)
+
+    def test_multipart_file(self):
+        image = SimpleUploadedFile('face.jpg', _jpeg('gray'), content_type='image/jpeg')
+        response = self.client.post('/api/data/detect-emotion/', {'image': image, 'target_emotion': 'happy', 'response_time_ms': 300})
+        self.assertMatch(response)
+
+    def test_octet_stream_body_with_query_params(self):
+        response = self.client.post('/api/data/detect-emotion/?target_emotion=happy&response_time_ms=300', _jpeg('gray'), content_type='application/octet-stream')
+        self.assertMatch(response)
+
+    def test_missing_image_or_fields(self):
+        response = self.client.post('/api/data/detect-emotion/', {'target_emotion': 'happy', 'response_time_ms': 300}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/data/detect-emotion/?target_emotion=happy', _jpeg('gray'), content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+        self.vision.face_detection.assert_not_called()
+
+def _pattern_jpeg(kind):
+    """dHash 가 서로 멀리 떨어진 프레임: 오른쪽으로 밝아짐(0), 어두워짐(모두 1), 세로 줄무늬(절반)"""
+    if kind == 'stripes':
+        image = Image.new('L', (252, 252))
+        image.putdata([255 if (x // 28) % 2 else 0 for y in range(252) for x in range(252)])
+    else:
+        image = Image.linear_gradient('L').rotate(90 if kind == 'brighter' else 270)
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG')
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+def _annotated(*faces):
+    return SimpleNamespace(error=SimpleNamespace(message=''), face_annotations=list(faces))
+
+@override_settings(CACHES=LOCMEM_CACHES, EMOTION_CACHE_TTL=60)
+class DetectEmotionBatchTests(TestCase):
+    """여러 프레임을 Vision batch 요청 한 번으로 판정하고, 캐시에 있는 프레임은 요청에서 뺍니다."""
+
+    def setUp(self):
+        cache.clear()
+        self.vision = mock.Mock()
+        patcher = mock.patch('data.emotion_utils.get_client', return_value=self.vision)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detect(self, kinds, target_emotion='happy', **data):
+        self.vision.batch_annotate_images.reset_mock()
+        images = [_pattern_jpeg(kind) for kind in kinds]
+        return self.client.post('/api/data/detect-emotion/batch/', {'images': images, 'target_emotion': target_emotion, **data}, content_type='application/json')
+
+    def sent_image_count(self):
+        return len(self.vision.batch_annotate_images.call_args.kwargs['requests'])
+
+    def test_frames_and_best_frame(self):
+        self.vision.batch_annotate_images.return_value = SimpleNamespace(responses=[
+            _annotated(_face(joy_likelihood=3)), _annotated(_face(joy_likelihood=5)), _annotated(),
+        ])
+        response = self.detect(['brighter', 'darker', 'stripes'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sent_image_count(), 3)
+        self.assertEqual(response.data['best_frame'], 1)
+        self.assertTrue(response.data['is_match'])
+        frames = response.data['frames']
+        self.assertEqual([frame.get('likelihoods', {}).get('joy_likelihood') for frame in frames], [3, 5, None])
+        self.assertEqual(frames[2], {'error': 'No face detected'})
+
+        response = self.detect(['brighter', 'darker', 'stripes'], target_emotion='sad')
+        self.assertEqual((response.data['best_frame'], response.data['is_match']), (0, False))
+
+    def test_no_face_in_any_frame(self):
+        self.vision.batch_annotate_images.return_value = SimpleNamespace(responses=[_annotated(), _annotated()])
+        response = self.detect(['brighter', 'darker'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['frames'], [{'error': 'No face detected'}] * 2)
+
+    def test_cached_frames_are_not_sent_to_vision(self):
+        self.vision.batch_annotate_images.return_value = SimpleNamespace(responses=[_annotated(_face(joy_likelihood=5)), _annotated()])
+        self.detect(['brighter', 'darker'], session_id=7)
+
+        self.vision.batch_annotate_images.return_value = SimpleNamespace(responses=[_annotated(_face(anger_likelihood=5))])
+        response = self.detect(['brighter', 'stripes', 'darker'], session_id=7)
+        self.assertEqual(self.sent_image_count(), 1)
+        frames = response.data['frames']
+        self.assertEqual(frames[0]['likelihoods']['joy_likelihood'], 5)
+        self.assertEqual(frames[1]['likelihoods']['anger_likelihood'], 5)
+        self.assertEqual(frames[2], {'error': 'No face detected'})
+        self.assertEqual(response.data['best_frame'], 0)
@@ -8,13 +8,19 @@ urlpatterns = [
     path('checklist/history/', GetChecklistHistoryView.as_view()),
 
     path('user-stats/', ComprehensiveStatsView.as_view()),
+    path('user-stats/batch/', CohortStatsView.as_view()),
 
     path('detect-emotion/', DetectEmotionView.as_view()),
+    path('detect-emotion/batch/', DetectEmotionBatchView.as_view()),
 
     path('ai-analysis/game1/', AnalyzeGame1StatsView.as_view()),
     path('ai-analysis/game2/', AnalyzeGame2StatsView.as_view()),
     path('ai-analysis/game3/', AnalyzeGame3StatsView.as_view()),
+    path('ai-analysis/all/', AnalyzeAllGameStatsView.as_view()),
+    path('ai-analysis/status/', AnalysisJobStatusView.as_view()),
 
     path('rl/game3/difficulty/', Game3RLDifficultyView.as_view(), name='game3-rl-difficulty'),
 
+    path('metrics/', MetricsView.as_view()),
+
 ]
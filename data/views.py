@@ -3,144 +3,180 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.utils import timezone
-from django.db.models import Avg, Count, Sum, F, Case, When, DurationField
-from django.db.models.functions import TruncDate
+from rest_framework.parsers import JSONParser, MultiPartParser
+from django.conf import settings
 from collections import defaultdict
-from google.cloud import vision
-import base64
 from .serializers import *
-import google.generativeai as genai
 import os
 import json
+import hashlib
 from dotenv import load_dotenv
-from datetime import date, timedelta
+from datetime import datetime, timedelta
+from django.utils import timezone
 
-from games.models import GameSession, GameInteractionLog 
+from games.models import GameDailyStat, to_local_date
+from games.rollup_utils import ROLLUP_COUNTERS, empty_bucket, merge_bucket
+from Zerodose import metrics
+from Zerodose.clients import get_client, timed
+from Zerodose.celery import app as celery_app
+from celery.result import AsyncResult
 from .models import ChecklistResult
+from .cache_utils import get_or_build_stats
+from .parsers import RawImageParser, ImageBodyParser
+from .image_utils import ImageTooLargeError, decode_data_url, preprocess_face_image
+from .emotion_utils import EMOTION_LIKELIHOOD_FIELDS, detect_face_likelihoods, detect_face_likelihoods_batch, match_emotion
+from .prompt_utils import prompt_json, compact_game_data, estimate_tokens, fit_prompt
+from .tasks import enqueue_game_analysis, get_analysis_job_id
 from users.models import User  
 
 from .agent import QLearningAgent
 from .rl_utils import get_user_state, calculate_reward_and_next_state
 
-
-class DateEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, date):
-            return o.isoformat()
-        return super().default(o)
-
 # --- Stats Generation Functions ---
 
-def _get_base_querysets(user_id):
-    today = timezone.now().date()
-    sessions = GameSession.objects.filter(user_id=user_id)
-    if not sessions.exists():
-        return None, None, None, today
-    session_assistance_map = {s.session_id: s.assistance_level for s in sessions}
-    logs = GameInteractionLog.objects.filter(session_id__in=sessions.values_list('session_id', flat=True))
-    return sessions, logs, session_assistance_map, today
-
-def _generate_game1_stats(user_id: int, sessions, logs, session_assistance_map, today) -> dict:
-    g1_sessions = sessions.filter(game_id=1)
-    g1_logs = logs.filter(session_id__in=g1_sessions.values_list('session_id', flat=True))
-    g1_today_logs = g1_logs.filter(timestamp__date=today)
-    g1_today_sessions = g1_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)
-    g1_today_duration_agg = g1_today_sessions.aggregate(total=Sum(F('session_end_time') - F('session_start_time')))['total']
-    daily_success_rate_trend_g1 = list(g1_logs.annotate(date=TruncDate('timestamp')).values('date').annotate(s=Count(Case(When(is_successful=True, then=1))), t=Count('log_id')).annotate(value=F('s')*100.0/F('t')).values('date', 'value').order_by('date'))
-    daily_response_time_trend_g1 = list(g1_logs.filter(response_time_ms__isnull=False).annotate(date=TruncDate('timestamp')).values('date').annotate(value=Avg('response_time_ms')).values('date', 'value').order_by('date'))
-    g1_assistance_success = defaultdict(int)
-    g1_assistance_total = defaultdict(int)
-    for log in g1_logs:
-        level = session_assistance_map.get(log.session_id)
+ASSISTANCE_LEVELS = ['NONE', 'VERBAL', 'PHYSICAL']
+
+def _rate(numerator, denominator):
+    return (numerator / denominator * 100) if denominator > 0 else 0
+
+def _average(total, count):
+    return (total / count) if count > 0 else 0
+
+def _get_stat_buckets_for_users(user_ids):
+    """
+    여러 사용자의 (game_id, 날짜, assistance_level) 일일 롤업 행을 한 번의 조회로 읽어 사용자별 버킷으로 나눕니다.
+    데이터가 없는 사용자는 결과에 포함되지 않습니다.
+    """
+    rows = GameDailyStat.objects.filter(user_id__in=user_ids).values_list('user_id', 'game_id', 'local_date', 'assistance_level', *ROLLUP_COUNTERS)
+    buckets_by_user = defaultdict(dict)
+    for user_id, game_id, date, level, *counters in rows.iterator(chunk_size=settings.STATS_ITERATOR_CHUNK_SIZE):
+        buckets_by_user[user_id][(game_id, date, level)] = dict(zip(ROLLUP_COUNTERS, counters))
+    return buckets_by_user
+
+def _get_stat_buckets(user_id):
+    """사용자의 일일 롤업 행을 버킷으로 읽어옵니다. 원본 로그 대신 GameDailyStat 한 번의 조회로 충분합니다."""
+    return _get_stat_buckets_for_users([user_id]).get(user_id)
+
+def _fold_buckets(buckets, game_id, today):
+    """한 게임의 버킷을 오늘/전체/날짜별/도움 수준별 합계로 접습니다."""
+    folded = {'today': empty_bucket(), 'overall': empty_bucket(), 'by_date': defaultdict(empty_bucket), 'by_level': defaultdict(empty_bucket)}
+    for (bucket_game_id, date, level), bucket in buckets.items():
+        if bucket_game_id != game_id:
+            continue
+        merge_bucket(folded['overall'], bucket)
+        merge_bucket(folded['by_date'][date], bucket)
+        if date == today:
+            merge_bucket(folded['today'], bucket)
         if level:
-            g1_assistance_total[level] += 1
-            if log.is_successful: g1_assistance_success[level] += 1
+            merge_bucket(folded['by_level'][level], bucket)
+    return folded
+
+def _daily_trend(by_date, value_fn, include_fn):
+    return [{'date': date, 'value': value_fn(bucket)} for date, bucket in sorted(by_date.items()) if include_fn(bucket)]
+
+def _generate_game1_stats(buckets, today) -> dict:
+    g1 = _fold_buckets(buckets, 1, today)
+    today_bucket, overall, by_level = g1['today'], g1['overall'], g1['by_level']
     return {
-        'today_attempts': g1_today_logs.count(),
-        'today_success_rate': (g1_today_logs.filter(is_successful=True).count() / g1_today_logs.count() * 100) if g1_today_logs.count() > 0 else 0,
-        'today_play_duration_seconds': g1_today_duration_agg.total_seconds() if g1_today_duration_agg else 0,
-        'overall_avg_success_rate': (g1_logs.filter(is_successful=True).count() / g1_logs.count() * 100) if g1_logs.count() > 0 else 0,
-        'overall_avg_response_time': g1_logs.aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
-        'daily_success_rate_trend': daily_success_rate_trend_g1,
-        'daily_response_time_trend': daily_response_time_trend_g1,
-        'success_rate_by_assistance': { level: (g1_assistance_success[level] / g1_assistance_total[level] * 100) if g1_assistance_total[level] > 0 else 0 for level in ['NONE', 'VERBAL', 'PHYSICAL'] }
+        'today_attempts': today_bucket['attempts'],
+        'today_success_rate': _rate(today_bucket['successes'], today_bucket['attempts']),
+        'today_play_duration_seconds': today_bucket['play_seconds'],
+        'overall_avg_success_rate': _rate(overall['successes'], overall['attempts']),
+        'overall_avg_response_time': _average(overall['response_time_sum'], overall['response_time_count']),
+        'daily_success_rate_trend': _daily_trend(g1['by_date'], lambda b: b['successes'] * 100.0 / b['attempts'], lambda b: b['attempts'] > 0),
+        'daily_response_time_trend': _daily_trend(g1['by_date'], lambda b: b['response_time_sum'] / b['response_time_count'], lambda b: b['response_time_count'] > 0),
+        'success_rate_by_assistance': { level: _rate(by_level[level]['successes'], by_level[level]['attempts']) for level in ASSISTANCE_LEVELS }
     }
 
-def _generate_game2_stats(user_id: int, sessions, logs, session_assistance_map, today) -> dict:
-    g2_sessions = sessions.filter(game_id=2)
-    g2_logs = logs.filter(session_id__in=g2_sessions.values_list('session_id', flat=True))
-    daily_response_time_trend_g2 = list(g2_logs.filter(response_time_ms__isnull=False).annotate(date=TruncDate('timestamp')).values('date').annotate(value=Avg('response_time_ms')).values('date', 'value').order_by('date'))
-    g2_today_sessions = g2_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)
-    today_play_duration_agg = g2_today_sessions.aggregate(total=Sum(F('session_end_time') - F('session_start_time')))['total']
-    total_play_time_agg = g2_sessions.exclude(session_end_time__isnull=True).aggregate(total=Sum(F('session_end_time') - F('session_start_time')))['total']
-    total_play_days = g2_sessions.annotate(date=TruncDate('session_start_time')).values('date').distinct().count()
-    daily_g2_play_time = (g2_sessions.exclude(session_end_time__isnull=True).annotate(date=TruncDate('session_start_time')).values('date').annotate(total_duration=Sum(F('session_end_time') - F('session_start_time'))))
-    daily_play_time_trend_g2 = [{'date': entry['date'], 'value': entry['total_duration'].total_seconds() if entry['total_duration'] else 0} for entry in daily_g2_play_time]
-    play_time_by_assistance = {}
-    for level in ['NONE', 'VERBAL', 'PHYSICAL']:
-        duration_agg = g2_sessions.filter(assistance_level=level, session_end_time__isnull=False).aggregate(total=Sum(F('session_end_time') - F('session_start_time'), output_field=DurationField()))['total']
-        play_time_by_assistance[level] = duration_agg.total_seconds() if duration_agg else 0
+def _generate_game2_stats(buckets, today) -> dict:
+    g2 = _fold_buckets(buckets, 2, today)
+    today_bucket, overall, by_level = g2['today'], g2['overall'], g2['by_level']
+    total_play_days = sum(1 for bucket in g2['by_date'].values() if bucket['session_count'] > 0)
     return {
-        'today_play_count': g2_today_sessions.count(),
-        'today_play_duration_seconds': today_play_duration_agg.total_seconds() if today_play_duration_agg else 0,
-        'today_avg_response_time': g2_logs.filter(timestamp__date=today).aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
-        'overall_avg_response_time': g2_logs.aggregate(avg=Avg('response_time_ms'))['avg'] or 0,
-        'avg_daily_play_time_seconds': (total_play_time_agg.total_seconds() / total_play_days) if total_play_days > 0 and total_play_time_agg else 0,
-        'daily_response_time_trend': daily_response_time_trend_g2,
-        'daily_play_time_trend': daily_play_time_trend_g2,
-        'play_time_by_assistance': play_time_by_assistance
+        'today_play_count': today_bucket['completed_session_count'],
+        'today_play_duration_seconds': today_bucket['play_seconds'],
+        'today_avg_response_time': _average(today_bucket['response_time_sum'], today_bucket['response_time_count']),
+        'overall_avg_response_time': _average(overall['response_time_sum'], overall['response_time_count']),
+        'avg_daily_play_time_seconds': _average(overall['play_seconds'], total_play_days),
+        'daily_response_time_trend': _daily_trend(g2['by_date'], lambda b: b['response_time_sum'] / b['response_time_count'], lambda b: b['response_time_count'] > 0),
+        'daily_play_time_trend': _daily_trend(g2['by_date'], lambda b: b['play_seconds'], lambda b: b['completed_session_count'] > 0),
+        'play_time_by_assistance': { level: by_level[level]['play_seconds'] for level in ASSISTANCE_LEVELS }
     }
 
-def _generate_game3_stats(user_id: int, sessions, logs, session_assistance_map, today) -> dict:
-    g3_sessions = sessions.filter(game_id=3)
-    g3_logs = logs.filter(session_id__in=g3_sessions.values_list('session_id', flat=True))
-    g3_today_logs = g3_logs.filter(timestamp__date=today)
-    g3_today_sessions = g3_sessions.filter(session_start_time__date=today, session_end_time__isnull=False)
-    g3_today_duration_agg = g3_today_sessions.aggregate(total=Sum(F('session_end_time') - F('session_start_time')))['total']
-    daily_g3_success_rate_trend = list(g3_logs.annotate(date=TruncDate('timestamp')).values('date').annotate(s=Count(Case(When(is_successful=True, then=1))), t=Count('log_id')).annotate(value=F('s')*100.0/F('t')).values('date', 'value').order_by('date'))
-    daily_power_data, g3_assistance_power = defaultdict(lambda: {'total': 0, 'count': 0}), defaultdict(lambda: {'total': 0, 'count': 0})
-    g3_assistance_success, g3_assistance_total = defaultdict(int), defaultdict(int)
-    for log in g3_logs:
-        power = log.interaction_data.get('throw_power')
-        if power is not None:
-            date = log.timestamp.date()
-            daily_power_data[date]['total'] += power
-            daily_power_data[date]['count'] += 1
-        level = session_assistance_map.get(log.session_id)
-        if level:
-            g3_assistance_total[level] += 1
-            if log.is_successful: g3_assistance_success[level] += 1
-            if power is not None:
-                g3_assistance_power[level]['total'] += power
-                g3_assistance_power[level]['count'] += 1
-    daily_avg_power_trend = [{'date': date, 'value': data['total'] / data['count']} for date, data in sorted(daily_power_data.items())]
+def _generate_game3_stats(buckets, today) -> dict:
+    g3 = _fold_buckets(buckets, 3, today)
+    today_bucket, overall, by_level = g3['today'], g3['overall'], g3['by_level']
     return {
-        'today_attempts': g3_today_logs.count(),
-        'today_success_rate': (g3_today_logs.filter(is_successful=True).count() / g3_today_logs.count() * 100) if g3_today_logs.count() > 0 else 0,
-        'today_play_duration_seconds': g3_today_duration_agg.total_seconds() if g3_today_duration_agg else 0,
-        'overall_avg_success_rate': (g3_logs.filter(is_successful=True).count() / g3_logs.count() * 100) if g3_logs.count() > 0 else 0,
-        'daily_success_rate_trend': daily_g3_success_rate_trend,
-        'daily_avg_power_trend': daily_avg_power_trend,
-        'success_rate_by_assistance': { level: (g3_assistance_success[level] / g3_assistance_total[level] * 100) if g3_assistance_total[level] > 0 else 0 for level in ['NONE', 'VERBAL', 'PHYSICAL'] },
-        'avg_power_by_assistance': { level: (data['total'] / data['count']) if data['count'] > 0 else 0 for level, data in g3_assistance_power.items() }
+        'today_attempts': today_bucket['attempts'],
+        'today_success_rate': _rate(today_bucket['successes'], today_bucket['attempts']),
+        'today_play_duration_seconds': today_bucket['play_seconds'],
+        'overall_avg_success_rate': _rate(overall['successes'], overall['attempts']),
+        'daily_success_rate_trend': _daily_trend(g3['by_date'], lambda b: b['successes'] * 100.0 / b['attempts'], lambda b: b['attempts'] > 0),
+        'daily_avg_power_trend': _daily_trend(g3['by_date'], lambda b: b['throw_power_sum'] / b['throw_power_count'], lambda b: b['throw_power_count'] > 0),
+        'success_rate_by_assistance': { level: _rate(by_level[level]['successes'], by_level[level]['attempts']) for level in ASSISTANCE_LEVELS },
+        'avg_power_by_assistance': { level: bucket['throw_power_sum'] / bucket['throw_power_count'] for level, bucket in by_level.items() if bucket['throw_power_count'] > 0 }
     }
 
+def _build_user_stats(buckets, today) -> dict:
+    return {
+        'game1': _generate_game1_stats(buckets, today),
+        'game2': _generate_game2_stats(buckets, today),
+        'game3': _generate_game3_stats(buckets, today),
+    }
+
+def _default_stats() -> dict:
+    default_assistance = {'NONE': 0, 'VERBAL': 0, 'PHYSICAL': 0}
+    return {
+        'game1': {'today_attempts': 0, 'today_success_rate': 0, 'today_play_duration_seconds': 0, 'overall_avg_success_rate': 0, 'overall_avg_response_time': 0, 'daily_success_rate_trend': [], 'daily_response_time_trend': [], 'success_rate_by_assistance': default_assistance},
+        'game2': {'today_play_count': 0, 'today_play_duration_seconds': 0, 'today_avg_response_time': 0, 'overall_avg_response_time': 0, 'avg_daily_play_time_seconds': 0, 'daily_response_time_trend': [], 'daily_play_time_trend':[], 'play_time_by_assistance': default_assistance},
+        'game3': {'today_attempts': 0, 'today_success_rate': 0, 'today_play_duration_seconds': 0, 'overall_avg_success_rate': 0, 'daily_success_rate_trend': [], 'daily_avg_power_trend': [], 'success_rate_by_assistance': default_assistance, 'avg_power_by_assistance': default_assistance}
+    }
+
+def _get_user_stats(user_id: int):
+    """
+    사용자의 game1/game2/game3 통계를 반환합니다. 데이터가 없으면 None.
+    게임 데이터가 바뀌어 버전이 올라가기 전(또는 날짜가 바뀌기 전)까지는 캐시에서 바로 반환합니다.
+    """
+    today = to_local_date()
+
+    def build():
+        buckets = _get_stat_buckets(user_id)
+        return _build_user_stats(buckets, today) if buckets is not None else None
+
+    return get_or_build_stats(user_id, 'games', build, today)
+
 def _generate_comprehensive_stats(user_id: int) -> dict:
-    sessions, logs, session_assistance_map, today = _get_base_querysets(user_id)
-    if sessions is None:
-        default_assistance = {'NONE': 0, 'VERBAL': 0, 'PHYSICAL': 0}
-        return {
-            'game1': {'today_attempts': 0, 'today_success_rate': 0, 'today_play_duration_seconds': 0, 'overall_avg_success_rate': 0, 'overall_avg_response_time': 0, 'daily_success_rate_trend': [], 'daily_response_time_trend': [], 'success_rate_by_assistance': default_assistance},
-            'game2': {'today_play_count': 0, 'today_play_duration_seconds': 0, 'today_avg_response_time': 0, 'overall_avg_response_time': 0, 'avg_daily_play_time_seconds': 0, 'daily_response_time_trend': [], 'daily_play_time_trend':[], 'play_time_by_assistance': default_assistance},
-            'game3': {'today_attempts': 0, 'today_success_rate': 0, 'today_play_duration_seconds': 0, 'overall_avg_success_rate': 0, 'daily_success_rate_trend': [], 'daily_avg_power_trend': [], 'success_rate_by_assistance': default_assistance, 'avg_power_by_assistance': default_assistance}
+    stats = _get_user_stats(user_id)
+    return stats if stats is not None else _default_stats()
+
+def _filter_trends_since(user_id: int, stats: dict, since) -> dict:
+    """
+    통계에서 since 이후 바뀐 날짜의 추이(daily_*) 포인트만 남깁니다. 나머지 요약 값은 그대로 둡니다.
+    since 가 날짜면 그 날짜 이후, 커서(datetime)면 그 시각 이후 롤업이 갱신된 (게임, 날짜)만 남깁니다.
+    """
+    if isinstance(since, datetime):
+        changed = set(GameDailyStat.objects.filter(user_id=user_id, updated_at__gt=since).values_list('game_id', 'local_date').distinct())
+        keep = lambda game_id, point_date: (game_id, point_date) in changed
+    else:
+        keep = lambda game_id, point_date: point_date >= since
+
+    filtered = {}
+    for game_key, game_stats in stats.items():
+        game_id = int(game_key.replace('game', ''))
+        filtered[game_key] = {
+            field: [point for point in value if keep(game_id, point['date'])] if field.startswith('daily_') else value
+            for field, value in game_stats.items()
         }
-    
-    g1_stats = _generate_game1_stats(user_id, sessions, logs, session_assistance_map, today)
-    g2_stats = _generate_game2_stats(user_id, sessions, logs, session_assistance_map, today)
-    g3_stats = _generate_game3_stats(user_id, sessions, logs, session_assistance_map, today)
-    
-    return {'game1': g1_stats, 'game2': g2_stats, 'game3': g3_stats }
+    return filtered
+
+def _generate_cohort_stats(user_ids) -> dict:
+    """여러 사용자의 통계를 롤업 1번 조회로 한꺼번에 계산합니다. {user_id: 통계}"""
+    today = to_local_date()
+    buckets_by_user = _get_stat_buckets_for_users(user_ids)
+    return {
+        user_id: _build_user_stats(buckets_by_user[user_id], today) if user_id in buckets_by_user else _default_stats()
+        for user_id in user_ids
+    }
 
 # --- Other Views ---
 
@@ -164,11 +200,17 @@ class GetChecklistHistoryView(APIView):
 
 class ComprehensiveStatsView(APIView):
     def post(self, request, *args, **kwargs):
-        req_serializer = StatsRequestSerializer(data=request.data)
+        req_serializer = ComprehensiveStatsRequestSerializer(data=request.data)
         if not req_serializer.is_valid():
             return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         user_id = req_serializer.validated_data['user_id']
+        since = req_serializer.validated_data.get('since')
+
+        # 다음 증분 요청에 쓸 커서는 통계를 읽기 전에 잡아 둡니다. (겹치는 구간은 클라이언트가 병합)
+        cursor = timezone.now() - timedelta(seconds=settings.STATS_DELTA_CURSOR_OVERLAP_SECONDS)
         statistics_data = _generate_comprehensive_stats(user_id)
+        if since is not None:
+            statistics_data = _filter_trends_since(user_id, statistics_data, since)
         try:
             user = User.objects.get(user_id=user_id)
             analysis_data = { 'game1_analysis': user.game1_analysis, 'game2_analysis': user.game2_analysis, 'game3_analysis': user.game3_analysis, }
@@ -177,139 +219,415 @@ class ComprehensiveStatsView(APIView):
         response_data = { 'statistics': statistics_data, **analysis_data }
         serializer = UserStatsWithAnalysisSerializer(data=response_data)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({**serializer.data, 'is_delta': since is not None, 'cursor': cursor.isoformat()}, status=status.HTTP_200_OK)
+
+class CohortStatsView(APIView):
+    """
+    여러 아동(user_ids)의 통계와 AI 분석 결과를 한 번에 반환하는 API (치료사용)
+    사용자 수와 관계없이 롤업 조회 1번 + 사용자 조회 1번으로 처리합니다.
+    """
+    def post(self, request, *args, **kwargs):
+        req_serializer = CohortStatsRequestSerializer(data=request.data)
+        if not req_serializer.is_valid():
+            return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        user_ids = list(dict.fromkeys(req_serializer.validated_data['user_ids']))  # 순서를 유지하며 중복 제거
+
+        statistics_by_user = _generate_cohort_stats(user_ids)
+        analyses = {
+            row['user_id']: row
+            for row in User.objects.filter(user_id__in=user_ids).values('user_id', 'game1_analysis', 'game2_analysis', 'game3_analysis')
+        }
+        response_data = []
+        for user_id in user_ids:
+            analysis = analyses.get(user_id, {})
+            response_data.append({
+                'statistics': statistics_by_user[user_id],
+                'game1_analysis': analysis.get('game1_analysis') or {},
+                'game2_analysis': analysis.get('game2_analysis') or {},
+                'game3_analysis': analysis.get('game3_analysis') or {},
+            })
+        serializer = UserStatsWithAnalysisSerializer(data=response_data, many=True)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': dict(zip(user_ids, serializer.data))}, status=status.HTTP_200_OK)
+
+def _read_image_bytes(image):
+    """ImageDataField 값(base64 data URL 또는 업로드 파일)을 바이트로 읽습니다."""
+    if isinstance(image, str):
+        return decode_data_url(image)
+    if image.size > settings.EMOTION_IMAGE_MAX_BYTES:
+        metrics.incr('emotion_image.rejected')
+        raise ImageTooLargeError(f"Image is larger than {settings.EMOTION_IMAGE_MAX_BYTES} bytes.")
+    return image.read()
 
 class DetectEmotionView(APIView):
+    # 기존 JSON(base64) 외에 multipart 파일과 이미지 바이트 본문도 받습니다. (base64 대비 본문이 약 25% 작고 디코딩 복사가 없습니다)
+    parser_classes = [JSONParser, MultiPartParser, RawImageParser, ImageBodyParser]
+
     def post(self, request, *args, **kwargs):
-        serializer = DetectEmotionSerializer(data=request.data)
+        # 본문을 읽기 전에 Content-Length 로 너무 큰 요청을 거절합니다. (base64 는 원본보다 약 4/3 배 큽니다)
+        if int(request.META.get('CONTENT_LENGTH') or 0) > settings.EMOTION_IMAGE_MAX_BYTES * 4 // 3 + 1024:
+            metrics.incr('emotion_image.rejected')
+            return Response({"error": "Image is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        # octet-stream/image 본문은 파서가 bytes 로 넘겨주므로 나머지 필드는 쿼리 파라미터에서 읽습니다.
+        raw_image = request.data if isinstance(request.data, bytes) else None
+        serializer = DetectEmotionSerializer(
+            data=request.query_params if raw_image is not None else request.data,
+            context={'raw_image': raw_image is not None},
+        )
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        image_data = serializer.validated_data['image']
         target_emotion = serializer.validated_data['target_emotion']
-        header, encoded = image_data.split(",", 1)
-        image_content = base64.b64decode(encoded)
-        client = vision.ImageAnnotatorClient()
-        image = vision.Image(content=image_content)
-        response = client.face_detection(image=image)
-        face_annotations = response.face_annotations
-        if not face_annotations:
+        try:
+            # 축소/JPEG 재인코딩으로 Vision 업로드 크기와 지연 시간을 줄입니다.
+            image_content = preprocess_face_image(raw_image if raw_image is not None else _read_image_bytes(serializer.validated_data['image']))
+        except ImageTooLargeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except (ValueError, OSError):
+            return Response({"error": "Invalid image data"}, status=status.HTTP_400_BAD_REQUEST)
+        # session_id 를 주면 같은 게임 세션의 프레임끼리만 캐시를 공유합니다. 없으면 캐시를 쓰지 않습니다.
+        scope = serializer.validated_data.get('session_id')
+        likelihoods = detect_face_likelihoods(image_content, scope)
+        if likelihoods is None:
             return Response({"error": "No face detected"}, status=status.HTTP_400_BAD_REQUEST)
         
-        is_match = False
-        if target_emotion == 'happy': is_match = face_annotations[0].joy_likelihood >= 3
-        elif target_emotion == 'sad': is_match = face_annotations[0].sorrow_likelihood >= 3
-        elif target_emotion == 'surprised': is_match = face_annotations[0].surprise_likelihood >= 3
-        elif target_emotion == 'angry': is_match = face_annotations[0].anger_likelihood >= 3
-        
-        return Response({"is_match": is_match}, status=status.HTTP_200_OK)
+        return Response({"is_match": match_emotion(likelihoods, target_emotion)}, status=status.HTTP_200_OK)
+
+class DetectEmotionBatchView(APIView):
+    """
+    표정을 유지하는 동안 연속으로 찍은 여러 프레임을 한 번에 판정하는 API.
+    Vision batch_annotate_images 한 번으로 처리하고, 프레임별 likelihood 와 가장 잘 맞는 프레임 기준의 is_match 를 반환합니다.
+    """
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        if int(request.META.get('CONTENT_LENGTH') or 0) > (settings.EMOTION_IMAGE_MAX_BYTES * 4 // 3 + 1024) * settings.EMOTION_BATCH_MAX_FRAMES:
+            metrics.incr('emotion_image.rejected')
+            return Response({"error": "Request is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        serializer = DetectEmotionBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        target_emotion = serializer.validated_data['target_emotion']
+        try:
+            image_contents = [preprocess_face_image(_read_image_bytes(image)) for image in serializer.validated_data['images']]
+        except ImageTooLargeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except (ValueError, OSError):
+            return Response({"error": "Invalid image data"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = serializer.validated_data.get('session_id')
+        target_field = EMOTION_LIKELIHOOD_FIELDS.get(target_emotion)
+        frames, best_frame, best_likelihood = [], None, -1
+        for index, (likelihoods, error) in enumerate(detect_face_likelihoods_batch(image_contents, scope)):
+            if likelihoods is None:
+                frames.append({"error": error})
+                continue
+            frames.append({"likelihoods": likelihoods, "is_match": match_emotion(likelihoods, target_emotion)})
+            if target_field and likelihoods[target_field] > best_likelihood:
+                best_frame, best_likelihood = index, likelihoods[target_field]
+
+        if all("error" in frame for frame in frames):
+            return Response({"error": "No face detected", "frames": frames}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "is_match": best_frame is not None and frames[best_frame]["is_match"],
+            "best_frame": best_frame,
+            "frames": frames,
+        }, status=status.HTTP_200_OK)
+
+class MetricsView(APIView):
+    """캐시 적중률 등 서버 내부 카운터를 반환하는 API"""
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
 
 # --- Refactored AI Analysis Views ---
 
-class BaseAnalyzeGameStatsView(APIView):
-    game_key = None
-    game_name = None
+ANALYSIS_MODEL_NAME = settings.GEMINI_MODEL_NAME
 
-    def get_game_data(self, user_id, sessions, logs, session_assistance_map, today):
-        raise NotImplementedError("Subclasses must implement get_game_data.")
+def analysis_fingerprint(prompt):
+    """프롬프트(통계 데이터 + 템플릿)와 모델 이름의 sha256. 같으면 같은 분석 결과가 나온다고 보고 재사용합니다."""
+    return hashlib.sha256(f'{ANALYSIS_MODEL_NAME}\n{prompt}'.encode('utf-8')).hexdigest()
 
-    def create_analysis_prompt(self, game_data: dict) -> str:
-        data_string = json.dumps(game_data, indent=4, ensure_ascii=False, cls=DateEncoder)
-        
-        # [수정] AI가 직접 단위를 변환하도록 프롬프트를 대폭 수정
-        prompt = f"""
+def _analysis_state_fields(game_key):
+    return [f'{game_key}_analysis_hash', f'{game_key}_analyzed_at']
+
+def _is_analysis_fresh(row, game_key, fingerprint):
+    """row(User 의 hash/analyzed_at 값)의 저장된 결과가 같은 프롬프트로 만들어졌고 AI_ANALYSIS_CACHE_TTL 이 지나지 않았으면 True"""
+    if not row or row[f'{game_key}_analysis_hash'] != fingerprint:
+        return False
+    ttl = settings.AI_ANALYSIS_CACHE_TTL
+    analyzed_at = row[f'{game_key}_analyzed_at']
+    return ttl is None or (analyzed_at is not None and timezone.now() - analyzed_at < timedelta(seconds=ttl))
+
+def _analysis_result_fields(game_key, analysis_result, fingerprint, checked_at=None):
+    now = timezone.now()
+    return {
+        f'{game_key}_analysis': analysis_result,
+        f'{game_key}_analysis_hash': fingerprint,
+        f'{game_key}_analyzed_at': now,
+        f'{game_key}_checked_at': checked_at or now,
+    }
+
+# [수정] AI가 직접 단위를 변환하도록 프롬프트를 대폭 수정
+ANALYSIS_INSTRUCTIONS = [
+    'Time values in the data are in MILLISECONDS (ms). In your summary, you MUST convert them to SECONDS (divided by 1000, rounded to one decimal place). For example, 5382ms should be reported as "5.4 seconds".',
+    "**Do not use any placeholders like '[Child's Name]'.** Focus entirely on the performance and what it signifies.",
+    'Trend lists keep the most recent days as daily points. Older days are summarized as weekly averages ("week" = Monday of that week, "days" = number of play days) and a single "before" average for anything older.',
+]
+
+def _analysis_prompt_intro(*extra_instructions):
+    """게임별/통합 분석 프롬프트가 공유하는 역할 설명과 CRITICAL INSTRUCTIONS. extra_instructions 는 번호를 이어서 붙입니다."""
+    instructions = "\n".join(
+        f"        {number}. {instruction}" for number, instruction in enumerate([*ANALYSIS_INSTRUCTIONS, *extra_instructions], 1)
+    )
+    return f"""
         You are a supportive developmental coach specializing in games for children with Autism Spectrum Disorder (ASD).
         Your primary goal is to empower parents by helping them see and celebrate their child's progress, no matter how small.
         You must respond in a deeply warm, hopeful, and encouraging tone.
 
         **CRITICAL INSTRUCTIONS:**
-        1. Time values in the data are in MILLISECONDS (ms). In your summary, you MUST convert them to SECONDS (divided by 1000, rounded to one decimal place). For example, 5382ms should be reported as "5.4 seconds".
-        2. **Do not use any placeholders like '[Child's Name]'.** Focus entirely on the performance and what it signifies.
-
-        Here is the statistical data from the '{self.game_name}' game session:
-        Data:
-        ```json
-        {data_string}
-        ```
-
-        Please analyze this data and identify the **single most positive sign of progress or effort**. 
-        Summarize this finding as a warm message of praise and hope for the parent.
-        Your message should be **exactly 3 lines long**, explain **why** this data point is a positive milestone, and include the key numbers (in seconds, if applicable).
+{instructions}
+"""
+
+class AnalysisRequestMixin:
+    """
+    분석 요청(POST) 공통 처리: 통계가 지난 분석 때와 같으면 저장된 결과를 그대로 사용하고,
+    아니면 Celery 큐에 넣습니다. ((user, game_key) 당 하나만 실행되도록 중복 제거)
+    하위 클래스는 game_key, game_name 과 is_up_to_date(user_id, stats) 를 정의합니다.
+    """
+    game_key = None
+    game_name = None
 
-        The analysis must be in English and formatted as a JSON object with the key "notable_points".
-        """
-        return prompt
+    def is_up_to_date(self, user_id, stats):
+        raise NotImplementedError
 
     def post(self, request, *args, **kwargs):
-        req_serializer = StatsRequestSerializer(data=request.data)
+        req_serializer = AnalyzeGameStatsRequestSerializer(data=request.data)
         if not req_serializer.is_valid():
             return Response(req_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         user_id = req_serializer.validated_data['user_id']
+        force = req_serializer.validated_data['force']
         
         try:
-            sessions, logs, session_assistance_map, today = _get_base_querysets(user_id)
-            if sessions is None:
+            stats = _get_user_stats(user_id)
+            if stats is None:
                 return Response({"error": f"No stats data found for User ID {user_id}."}, status=status.HTTP_404_NOT_FOUND)
+
+            # 통계가 지난 분석 때와 같으면 큐에 넣지 않고 저장된 결과를 그대로 사용합니다.
+            if not force and self.is_up_to_date(user_id, stats):
+                metrics.incr('ai_analysis.skipped')
+                return Response({
+                    "message": f"AI analysis for {self.game_name} for User ID {user_id} is already up to date.",
+                    "job_id": None,
+                }, status=status.HTTP_200_OK)
             
-            game_data = self.get_game_data(user_id, sessions, logs, session_assistance_map, today)
-            
-            gemini_api_key = os.getenv("GEMINI_API_KEY")
-            if not gemini_api_key:
+            if not os.getenv("GEMINI_API_KEY"):
                 raise ValueError("GEMINI_API_KEY is not set in the .env file.")
             
-            prompt = self.create_analysis_prompt(game_data)
-            
-            # 백그라운드에서 AI 분석 실행
-            import threading
-            thread = threading.Thread(target=self._run_ai_analysis, args=(user_id, prompt, gemini_api_key))
-            thread.start()
+            # Celery 큐에서 AI 분석 실행 ((user, game) 당 하나만 실행되도록 중복 제거)
+            job_id, created = enqueue_game_analysis(user_id, self.game_key, force=force)
             
             # 즉시 응답 반환
+            message = "has been started in the background." if created else "is already in progress."
             return Response({
-                "message": f"AI analysis for {self.game_name} for User ID {user_id} has been started in the background."
+                "message": f"AI analysis for {self.game_name} for User ID {user_id} {message}",
+                "job_id": job_id,
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _run_ai_analysis(self, user_id, prompt, gemini_api_key):
-        """백그라운드에서 실행될 AI 분석 메서드"""
-        try:
-            genai.configure(api_key=gemini_api_key)
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            
-            response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-            analysis_result = json.loads(response.text)
+class BaseAnalyzeGameStatsView(AnalysisRequestMixin, APIView):
+    def get_game_data(self, stats):
+        return stats[self.game_key]
 
-            user = User.objects.get(user_id=user_id)
-            setattr(user, f'{self.game_key}_analysis', analysis_result)
-            user.save()
-            
-            print(f"AI analysis for {self.game_name} for User ID {user_id} completed and saved successfully.")
-            
-        except Exception as e:
-            print(f"Error in background AI analysis for User ID {user_id}: {e}")
+    def is_analysis_fresh(self, user_id, fingerprint):
+        row = User.objects.filter(user_id=user_id).values(*_analysis_state_fields(self.game_key)).first()
+        return _is_analysis_fresh(row, self.game_key, fingerprint)
+
+    def is_up_to_date(self, user_id, stats):
+        return self.is_analysis_fresh(user_id, analysis_fingerprint(self.create_analysis_prompt(self.get_game_data(stats))))
+
+    def create_analysis_prompt(self, game_data: dict) -> str:
+        # 추이 데이터를 줄이고 공백 없이 직렬화해서, 사용 기간과 관계없이 프롬프트 크기를 일정하게 유지합니다.
+        return fit_prompt(
+            lambda recent_days, max_weeks: self.render_analysis_prompt(prompt_json(compact_game_data(game_data, recent_days, max_weeks))),
+            settings.AI_ANALYSIS_PROMPT_TOKEN_BUDGET,
+        )
+
+    def render_analysis_prompt(self, data_string: str) -> str:
+        prompt = f"""{_analysis_prompt_intro()}
+        Here is the statistical data from the '{self.game_name}' game session:
+        Data:
+        ```json
+        {data_string}
+        ```
+
+        Please analyze this data and identify the **single most positive sign of progress or effort**. 
+        Summarize this finding as a warm message of praise and hope for the parent.
+        Your message should be **exactly 3 lines long**, explain **why** this data point is a positive milestone, and include the key numbers (in seconds, if applicable).
+
+        The analysis must be in English and formatted as a JSON object with the key "notable_points".
+        """
+        return prompt
+
+    def run_analysis(self, user_id, force=False):
+        """Celery 워커에서 실행될 AI 분석 메서드. 실패하면 예외를 그대로 올려 재시도되게 합니다."""
+        checked_at = timezone.now()
+        stats = _get_user_stats(user_id)
+        if stats is None:
+            print(f"AI analysis for {self.game_name} skipped: no stats for User ID {user_id}.")
+            return
+        prompt = self.create_analysis_prompt(self.get_game_data(stats))
+        fingerprint = analysis_fingerprint(prompt)
+        # 큐에서 기다리는 동안 같은 통계로 분석이 끝났을 수도 있으므로 실행 직전에 한 번 더 확인합니다.
+        if not force and self.is_analysis_fresh(user_id, fingerprint):
+            metrics.incr('ai_analysis.skipped')
+            User.objects.filter(user_id=user_id).update(**{f'{self.game_key}_checked_at': checked_at})
+            print(f"AI analysis for {self.game_name} skipped: stats unchanged for User ID {user_id}.")
+            return
+
+        metrics.incr('ai_analysis.llm_call')
+        metrics.incr('ai_analysis.prompt_tokens', estimate_tokens(prompt))
+        with timed('gemini'):
+            response = get_client('gemini').generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        analysis_result = json.loads(response.text)
+
+        # 다른 필드를 덮어쓰지 않도록 분석 결과 컬럼만 UPDATE 합니다.
+        User.objects.filter(user_id=user_id).update(**_analysis_result_fields(self.game_key, analysis_result, fingerprint, checked_at))
+        
+        print(f"AI analysis for {self.game_name} for User ID {user_id} completed and saved successfully.")
 
 class AnalyzeGame1StatsView(BaseAnalyzeGameStatsView):
     game_key = 'game1'
     game_name = 'Look at That! (Attention & Eye Contact)'
     
-    def get_game_data(self, user_id, sessions, logs, session_assistance_map, today):
-        return _generate_game1_stats(user_id, sessions, logs, session_assistance_map, today)
-
 class AnalyzeGame2StatsView(BaseAnalyzeGameStatsView):
     game_key = 'game2'
     game_name = 'Making Faces (Emotional Expression)'
     
-    def get_game_data(self, user_id, sessions, logs, session_assistance_map, today):
-        return _generate_game2_stats(user_id, sessions, logs, session_assistance_map, today)
-
 class AnalyzeGame3StatsView(BaseAnalyzeGameStatsView):
     game_key = 'game3'
     game_name = 'Ball Toss (Interaction & Motor Skills)'
 
-    def get_game_data(self, user_id, sessions, logs, session_assistance_map, today):
-        return _generate_game3_stats(user_id, sessions, logs, session_assistance_map, today)
+class AnalyzeAllGameStatsView(AnalysisRequestMixin, APIView):
+    """
+    세 게임의 AI 분석을 한 번에 요청하는 API.
+    통계를 한 번만 계산하고, 바뀐 게임만 하나의 프롬프트로 묶어 Gemini 를 한 번만 호출한 뒤 User 에 한 번의 UPDATE 로 저장합니다.
+    """
+    game_key = 'all'
+    game_name = 'All Games'
+    game_views = [AnalyzeGame1StatsView, AnalyzeGame2StatsView, AnalyzeGame3StatsView]
+
+    def get_stale_games(self, user_id, stats, force=False):
+        """다시 분석해야 하는 게임의 [(view, game_data, fingerprint)] 목록"""
+        fields = [field for view in self.game_views for field in _analysis_state_fields(view.game_key)]
+        row = User.objects.filter(user_id=user_id).values(*fields).first()
+        stale = []
+        for view_class in self.game_views:
+            view = view_class()
+            game_data = view.get_game_data(stats)
+            # 게임별 엔드포인트와 같은 fingerprint 를 저장해서, 어느 쪽으로 분석했든 서로 재사용되게 합니다.
+            fingerprint = analysis_fingerprint(view.create_analysis_prompt(game_data))
+            if force or not _is_analysis_fresh(row, view.game_key, fingerprint):
+                stale.append((view, game_data, fingerprint))
+        return stale
+
+    def is_up_to_date(self, user_id, stats):
+        return not self.get_stale_games(user_id, stats)
+
+    def create_analysis_prompt(self, games) -> str:
+        return fit_prompt(
+            lambda recent_days, max_weeks: self.render_analysis_prompt([
+                (view, prompt_json(compact_game_data(game_data, recent_days, max_weeks))) for view, game_data, _ in games
+            ]),
+            settings.AI_ANALYSIS_PROMPT_TOKEN_BUDGET * len(games),
+        )
+
+    def render_analysis_prompt(self, games) -> str:
+        sections = "\n".join(
+            f"""
+        ### {view.game_key}: '{view.game_name}'
+        ```json
+        {data_string}
+        ```"""
+            for view, data_string in games
+        )
+        keys = ", ".join(f'"{view.game_key}"' for view, _ in games)
+
+        prompt = f"""{_analysis_prompt_intro("Analyze each game independently, using only that game's data.")}
+        Here is the statistical data from each game, keyed by game id:
+        {sections}
+
+        For **each** game above, identify the **single most positive sign of progress or effort**.
+        Summarize each finding as a warm message of praise and hope for the parent.
+        Each message should be **exactly 3 lines long**, explain **why** this data point is a positive milestone, and include the key numbers (in seconds, if applicable).
+
+        The analysis must be in English and formatted as a JSON object with exactly the keys {keys}.
+        Each value must be a JSON object with the key "notable_points".
+        """
+        return prompt
+
+    def run_analysis(self, user_id, force=False, stats=None, rate_limiter=None, checked_at=None):
+        """
+        Celery 워커/야간 배치에서 실행될 통합 AI 분석 메서드. 실패하면 예외를 그대로 올려 재시도되게 합니다.
+        stats 를 주면 다시 계산하지 않고(checked_at: 그 stats 를 읽기 시작한 시각), rate_limiter 를 주면 Gemini 호출 전에 rate_limiter.wait() 를 호출합니다.
+        통계가 같아 건너뛴 게임도 gameN_checked_at 을 갱신하므로, 야간 분석 대상에서 빠집니다.
+        반환값: 새로 분석한 game_key 목록
+        """
+        if stats is None:
+            checked_at = timezone.now()
+            stats = _get_user_stats(user_id)
+        if stats is None:
+            print(f"AI analysis for {self.game_name} skipped: no stats for User ID {user_id}.")
+            return []
+        checked_at = checked_at or timezone.now()
+        games = self.get_stale_games(user_id, stats, force)
+        stale_keys = {view.game_key for view, _, _ in games}
+        # 읽기 시작한 이후에 들어온 데이터는 updated_at 이 checked_at 보다 늦으므로 다음 실행 때 다시 대상이 됩니다.
+        update_fields = {f'{view.game_key}_checked_at': checked_at for view in self.game_views if view.game_key not in stale_keys}
+        if not games:
+            User.objects.filter(user_id=user_id).update(**update_fields)
+            metrics.incr('ai_analysis.skipped')
+            print(f"AI analysis for {self.game_name} skipped: stats unchanged for User ID {user_id}.")
+            return []
+
+        prompt = self.create_analysis_prompt(games)
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        metrics.incr('ai_analysis.llm_call')
+        metrics.incr('ai_analysis.prompt_tokens', estimate_tokens(prompt))
+        with timed('gemini'):
+            response = get_client('gemini').generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        analysis_result = json.loads(response.text)
+
+        for view, _, fingerprint in games:
+            if view.game_key not in analysis_result:
+                raise ValueError(f"AI response is missing the '{view.game_key}' analysis.")
+            update_fields.update(_analysis_result_fields(view.game_key, analysis_result[view.game_key], fingerprint, checked_at))
+        User.objects.filter(user_id=user_id).update(**update_fields)
+
+        print(f"AI analysis for {', '.join(view.game_key for view, _, _ in games)} for User ID {user_id} completed and saved successfully.")
+        return [view.game_key for view, _, _ in games]
+
+ANALYSIS_VIEWS = {view.game_key: view for view in [AnalyzeGame1StatsView, AnalyzeGame2StatsView, AnalyzeGame3StatsView, AnalyzeAllGameStatsView]}
+
+class AnalysisJobStatusView(APIView):
+    """AI 분석 작업의 진행 상태를 조회하는 API (job_id 또는 user_id + game_key)"""
+    def post(self, request, *args, **kwargs):
+        serializer = AnalysisJobStatusRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        job_id = serializer.validated_data.get('job_id')
+        if not job_id:
+            job_id = get_analysis_job_id(serializer.validated_data['user_id'], serializer.validated_data['game_key'])
+            if job_id is None:
+                return Response({"job_id": None, "state": "IDLE"}, status=status.HTTP_200_OK)
+
+        result = AsyncResult(job_id, app=celery_app)
+        response_data = {"job_id": job_id, "state": result.state}
+        if result.failed():
+            response_data["error"] = str(result.result)
+        return Response(response_data, status=status.HTTP_200_OK)
 
 
 # --- Q-Learning Views ---
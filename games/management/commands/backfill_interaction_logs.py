@@ -0,0 +1,70 @@
+# games/management/commands/backfill_interaction_logs.py
+
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Max
+from django.db.models.functions import TruncDate
+
+from games.models import GameSession, GameInteractionLog, extract_throw_power
+
+class Command(BaseCommand):
+    help = (
+        'Backfills the denormalized columns: user_id / game_id / assistance_level / local_date / throw_power on game_interaction_log '
+        'and local_date on game_session.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of primary key values updated per statement.')
+
+    def _pk_batches(self, queryset, pk_field, batch_size):
+        """한 번에 전체를 UPDATE 하면 테이블이 오래 잠기므로 PK 구간별로 나눠서 처리합니다."""
+        max_pk = queryset.aggregate(max_pk=Max(pk_field))['max_pk'] or 0
+        for start in range(0, max_pk + 1, batch_size):
+            yield queryset.filter(**{f'{pk_field}__gte': start, f'{pk_field}__lt': start + batch_size})
+
+    def _update_in_batches(self, queryset, pk_field, batch_size, **values):
+        return sum(batch.update(**values) for batch in self._pk_batches(queryset, pk_field, batch_size))
+
+    def _backfill_throw_power(self, batch_size):
+        """
+        쓰기 경로와 같은 규칙(JSON 숫자만)이 되도록 extract_throw_power 로 계산합니다.
+        SQL CAST 는 "55.5" 같은 문자열도 숫자로 바꾸고, 숫자가 아닌 값은 STRICT 모드에서 UPDATE 를 중간에 실패시킵니다.
+        """
+        queryset = GameInteractionLog.objects.filter(throw_power__isnull=True, interaction_data__has_key='throw_power')
+        updated = 0
+        for batch in self._pk_batches(queryset, 'log_id', batch_size):
+            logs = [
+                GameInteractionLog(log_id=log_id, throw_power=extract_throw_power(interaction_data))
+                for log_id, interaction_data in batch.values_list('log_id', 'interaction_data')
+            ]
+            logs = [log for log in logs if log.throw_power is not None]
+            GameInteractionLog.objects.bulk_update(logs, ['throw_power'])
+            updated += len(logs)
+        return updated
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stats_tz = ZoneInfo(settings.STATS_TIME_ZONE)
+        session = GameSession.objects.filter(session_id=OuterRef('session_id'))
+
+        sessions_updated = self._update_in_batches(
+            GameSession.objects.filter(local_date__isnull=True), 'session_id', batch_size,
+            local_date=TruncDate('session_start_time', tzinfo=stats_tz),
+        )
+        logs_updated = self._update_in_batches(
+            GameInteractionLog.objects.filter(user_id__isnull=True), 'log_id', batch_size,
+            user_id=Subquery(session.values('user_id')[:1]),
+            game_id=Subquery(session.values('game_id')[:1]),
+            assistance_level=Subquery(session.values('assistance_level')[:1]),
+        )
+        dates_updated = self._update_in_batches(
+            GameInteractionLog.objects.filter(local_date__isnull=True), 'log_id', batch_size,
+            local_date=TruncDate('timestamp', tzinfo=stats_tz),
+        )
+        powers_updated = self._backfill_throw_power(batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"세션 {sessions_updated}개, 로그 {logs_updated}개(세션 필드) / {dates_updated}개(local_date) / {powers_updated}개(throw_power)를 채웠습니다. "
+            "이후 rebuild_daily_stats 를 실행하세요."
+        ))
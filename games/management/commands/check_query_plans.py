@@ -0,0 +1,87 @@
+# games/management/commands/check_query_plans.py
+
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from games.models import GameSession, GameInteractionLog, GameDailyStat, FirstGameQuiz, QuizImage
+from games.rollup_utils import aggregate_logs
+from users.models import User
+from data.management.commands.run_nightly_analysis import users_needing_analysis
+
+# 백엔드별로 EXPLAIN 결과에서 "전체 테이블 스캔"을 나타내는 패턴 (그룹 1: 테이블 이름)
+FULL_SCAN_PATTERNS = {
+    'mysql': re.compile(r'"table_name":\s*"(\w+)"[^{}]*?"access_type":\s*"ALL"'),
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)'),  # 'SCAN t USING INDEX' 도 인덱스 전체를 읽으므로 포함 (범위 조회는 SEARCH)
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+# 전체 사용자를 훑는 배치 쿼리처럼 전체 스캔이 정상인 (쿼리 이름: 테이블) 목록
+ALLOWED_FULL_SCANS = {
+    'nightly: users needing analysis': {'users'},
+}
+
+def full_scan_tables(plan):
+    """EXPLAIN 결과에서 전체 스캔되는 테이블 이름 목록"""
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise CommandError(f"Unsupported database backend: {connection.vendor}")
+    return pattern.findall(plan)
+
+def explain_sql(sql):
+    """실행된 SQL 문자열(connection.queries 에 기록된 값)의 EXPLAIN 결과"""
+    prefix = connection.ops.explain_query_prefix(format='json' if connection.vendor == 'mysql' else None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}")
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+def hot_queries(user_id, session_id):
+    """
+    뷰와 유틸 함수가 실제로 실행하는 ORM 쿼리 목록 (이름, QuerySet).
+    테스트(games/tests.py)는 뷰를 직접 호출해 실제로 실행된 SQL 을 검사하므로, 이 목록은 운영 데이터에서 계획을 확인할 때 사용합니다.
+    """
+    return [
+        ('stats: rollup rows for user', GameDailyStat.objects.filter(user_id=user_id)),
+        ('stats: rollup rows changed since cursor', GameDailyStat.objects.filter(user_id=user_id, updated_at__gt='2025-01-01').values_list('game_id', 'local_date').distinct()),
+        ('cohort: analysis rows', User.objects.filter(user_id__in=[user_id]).values('user_id', 'game1_analysis', 'game2_analysis', 'game3_analysis')),
+        ('log: session lookup', GameSession.objects.filter(session_id__in=[session_id]).values('session_id', 'user_id', 'game_id', 'assistance_level')),
+        ('stats: rollup row lookup', GameDailyStat.objects.filter(user_id=user_id, game_id=3, local_date='2025-01-01', assistance_level='')),
+        ('rl: recent throw power', GameDailyStat.objects.filter(user_id=user_id, game_id=3, throw_power_count__gt=0).order_by('-local_date')[:20]),
+        ('rl: session reward logs', GameInteractionLog.objects.filter(session_id=session_id)),
+        ('session end: log aggregates', aggregate_logs(GameInteractionLog.objects.filter(session_id=session_id), 'local_date')),
+        ('rebuild: user sessions', GameSession.objects.filter(user_id=user_id)),
+        ('rebuild: user log aggregates', aggregate_logs(GameInteractionLog.objects.filter(user_id=user_id), 'game_id', 'local_date', 'assistance_level')),
+        ('quiz: ready quizzes', FirstGameQuiz.objects.filter(user_id=user_id, is_ready=True).order_by('created_at')[:3]),
+        ('quiz: latest quizzes', FirstGameQuiz.objects.filter(user_id=user_id).order_by('-created_at')[:3]),
+        ('quiz: image pools', QuizImage.objects.filter(prompt_key__in=['apple', 'red apple', 'car'], style_version='v1')),
+        ('nightly: users needing analysis', users_needing_analysis()),
+    ]
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the hot ORM queries used by the games/data views and fails when a full table scan appears. '
+        'Run it against a database with realistic data; optimizers may scan tiny tables regardless of indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='User to build sample queries for (defaults to the user of the latest session).')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every EXPLAIN output.')
+
+    def handle(self, *args, **options):
+        session = GameSession.objects.filter(user_id=options['user_id']).first() if options['user_id'] else GameSession.objects.first()
+        user_id = options['user_id'] or (session.user_id if session else 0)
+        session_id = session.session_id if session else 0
+
+        failures = []
+        for name, queryset in hot_queries(user_id, session_id):
+            plan = queryset.explain(format='json') if connection.vendor == 'mysql' else queryset.explain()
+            if options['verbose_plans']:
+                self.stdout.write(f"--- {name}\n{plan}")
+            if set(full_scan_tables(plan)) - ALLOWED_FULL_SCANS.get(name, set()):
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN: {name}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok: {name}"))
+
+        if failures:
+            raise CommandError(f"{len(failures)}개 쿼리에서 전체 테이블 스캔이 발견되었습니다: {', '.join(failures)}")
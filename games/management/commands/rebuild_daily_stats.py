@@ -0,0 +1,26 @@
+# games/management/commands/rebuild_daily_stats.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from games.models import GameSession
+from games.rollup_utils import rebuild_user_daily_stats
+from data.cache_utils import bump_stats_version
+
+class Command(BaseCommand):
+    help = 'Rebuilds the game_daily_stat rollup table from raw sessions and interaction logs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='Rebuild only this user (repeatable).')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or GameSession.objects.values_list('user_id', flat=True).distinct().order_by('user_id').iterator()
+
+        total_users, total_rows = 0, 0
+        for user_id in user_ids:
+            with transaction.atomic():
+                total_rows += rebuild_user_daily_stats(user_id)
+            bump_stats_version(user_id)
+            total_users += 1
+
+        self.stdout.write(self.style.SUCCESS(f"롤업 재계산 완료: 사용자 {total_users}명, {total_rows}개 행"))
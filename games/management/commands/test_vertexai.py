@@ -2,27 +2,8 @@
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
 import uuid
-import boto3
-from botocore.exceptions import NoCredentialsError
-
-def upload_to_s3(image_bytes, bucket_name, object_name):
-    """S3에 이미지 바이트를 업로드하고 URL을 반환하는 함수"""
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME
-    )
-    try:
-        s3_client.put_object(Body=image_bytes, Bucket=bucket_name, Key=object_name, ContentType='image/png')
-        url = f"https://{bucket_name}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{object_name}"
-        return url
-    except Exception as e:
-        print(f"S3 upload failed: {e}")
-        return None
+from Zerodose.clients import get_client, upload_to_s3
 
 class Command(BaseCommand):
     help = 'Tests Vertex AI image generation with a simple prompt.'
@@ -33,8 +14,7 @@ class Command(BaseCommand):
         prompt = "A smiling cartoon apple"
         
         try:
-            vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
-            model = ImageGenerationModel.from_pretrained("imagegeneration@005")
+            model = get_client('imagen')
             
             detailed_prompt = f"A simple, cute cartoon illustration of a {prompt}, on a clean white background"
             
@@ -1,7 +1,20 @@
+from zoneinfo import ZoneInfo
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from users.models import User # users 앱의 User 모델을 import
 
+def to_local_date(value=None):
+    """통계용 현지 날짜를 계산합니다. (settings.STATS_TIME_ZONE 기준, 기본값은 현재 시각)"""
+    return timezone.localdate(value or timezone.now(), timezone=ZoneInfo(settings.STATS_TIME_ZONE))
+
+def extract_throw_power(interaction_data):
+    """interaction_data 에서 throw_power 값을 꺼냅니다. 없거나 숫자가 아니면 None."""
+    if not isinstance(interaction_data, dict):
+        return None
+    power = interaction_data.get('throw_power')
+    return float(power) if isinstance(power, (int, float)) else None
+
 class GameSession(models.Model):
     session_id = models.AutoField(primary_key=True)
     user_id = models.IntegerField()
@@ -10,14 +23,23 @@ class GameSession(models.Model):
     session_end_time = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     assistance_level = models.CharField(max_length=20, null=True, blank=True)
+    local_date = models.DateField(null=True, blank=True)  # session_start_time 의 현지 날짜
 
     class Meta:
         db_table = 'game_session'
         ordering = ['-session_start_time']
+        indexes = [
+            models.Index(fields=['user_id', 'game_id', 'session_start_time'], name='session_user_game_start_idx'),
+        ]
 
     def __str__(self):
         return f"Session {self.session_id} for User {self.user_id}"
 
+    def save(self, *args, **kwargs):
+        if self.local_date is None:
+            self.local_date = to_local_date(self.session_start_time)
+        super().save(*args, **kwargs)
+
 class GameInteractionLog(models.Model):
     log_id = models.AutoField(primary_key=True)
     session_id = models.IntegerField()
@@ -26,14 +48,82 @@ class GameInteractionLog(models.Model):
     response_time_ms = models.IntegerField(null=True, blank=True)
     interaction_data = models.JSONField()
     game_type = models.IntegerField(default=0)  # 새로 추가된 필드
+    # 세션에서 복사해 두는 비정규화 필드 (통계 쿼리를 단일 테이블로 처리하기 위함)
+    user_id = models.IntegerField(null=True, blank=True)
+    game_id = models.IntegerField(null=True, blank=True)
+    assistance_level = models.CharField(max_length=20, null=True, blank=True)
+    local_date = models.DateField(null=True, blank=True)  # timestamp 의 현지 날짜 (조회는 (user_id, game_id, local_date) 인덱스로)
+    throw_power = models.FloatField(null=True, blank=True, db_index=True)  # interaction_data['throw_power'] (3번 게임)
 
     class Meta:
         db_table = 'game_interaction_log'
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['session_id', 'timestamp'], name='log_session_time_idx'),
+            models.Index(fields=['user_id', 'game_id', 'local_date'], name='log_user_game_date_idx'),
+        ]
 
     def __str__(self):
         return f"Log {self.log_id} for Session {self.session_id}"
+
+    def save(self, *args, **kwargs):
+        if self.local_date is None:
+            self.local_date = to_local_date(self.timestamp)
+        if self.throw_power is None:
+            self.throw_power = extract_throw_power(self.interaction_data)
+        super().save(*args, **kwargs)
     
+class GameDailyStat(models.Model):
+    """
+    (user, game, 날짜, 도움 수준) 단위의 일일 통계 롤업.
+    통계 API는 원본 로그 대신 이 작은 테이블을 읽습니다. (games/rollup_utils.py 에서 갱신)
+    """
+    stat_id = models.AutoField(primary_key=True)
+    user_id = models.IntegerField()
+    game_id = models.IntegerField()
+    local_date = models.DateField()
+    assistance_level = models.CharField(max_length=20, blank=True, default='')  # 세션 종료 전에는 ''
+    attempts = models.IntegerField(default=0)
+    successes = models.IntegerField(default=0)
+    response_time_sum = models.BigIntegerField(default=0)
+    response_time_count = models.IntegerField(default=0)
+    throw_power_sum = models.FloatField(default=0)
+    throw_power_count = models.IntegerField(default=0)
+    session_count = models.IntegerField(default=0)
+    completed_session_count = models.IntegerField(default=0)
+    play_seconds = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)  # since 증분 조회용 (F() update 시에는 직접 갱신)
+
+    class Meta:
+        db_table = 'game_daily_stat'
+        unique_together = ('user_id', 'game_id', 'local_date', 'assistance_level')
+        indexes = [
+            models.Index(fields=['user_id', 'updated_at'], name='daily_stat_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Daily stat for User {self.user_id} / Game {self.game_id} on {self.local_date}"
+
+class QuizImage(models.Model):
+    """
+    퀴즈용 AI 이미지 라이브러리. (정규화된 프롬프트, 스타일 버전) 별로 여러 장을 모아 두고 퀴즈를 만들 때 재사용합니다.
+    이미지 파일은 S3 에 있고, 여기에는 URL 만 저장합니다.
+    """
+    image_id = models.AutoField(primary_key=True)
+    prompt_key = models.CharField(max_length=100, help_text="정규화된 이미지 프롬프트. 예: red apple")
+    style_version = models.CharField(max_length=20)
+    image_url = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'quiz_images'
+        indexes = [
+            models.Index(fields=['prompt_key', 'style_version'], name='quiz_image_prompt_style_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.prompt_key} ({self.style_version})"
+
 class FirstGameQuiz(models.Model):
     quiz_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -45,6 +135,9 @@ class FirstGameQuiz(models.Model):
 
     class Meta:
         db_table = 'first_game_quizzes'
+        indexes = [
+            models.Index(fields=['user', 'is_ready', 'created_at'], name='quiz_user_ready_created_idx'),
+        ]
 
     def __str__(self):
         return self.prompt_text
\ No newline at end of file
@@ -0,0 +1,87 @@
+# games/quiz_images.py
+
+import hashlib
+import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections
+
+from Zerodose.clients import get_client, timed, upload_to_s3
+from .models import QuizImage
+
+# 이 템플릿을 바꾸면 QUIZ_IMAGE_STYLE_VERSION 도 올려서, 이전 스타일의 이미지가 섞이지 않게 합니다.
+IMAGE_PROMPT_TEMPLATE = "A simple cartoon of a {prompt}, on a clean white background, for children's learning"
+NEGATIVE_PROMPT = "text, words, realistic, photo, scary, complex, multiple objects"
+
+def normalize_prompt(prompt):
+    return ' '.join(prompt.lower().split())
+
+def _generate_image_bytes(prompt_key):
+    with timed('imagen'):
+        images = get_client('imagen').generate_images(
+            prompt=IMAGE_PROMPT_TEMPLATE.format(prompt=prompt_key),
+            number_of_images=1,
+            negative_prompt=NEGATIVE_PROMPT
+        )
+    return images[0]._image_bytes if images else None
+
+def add_library_image(prompt_key):
+    """Vertex AI 로 이미지를 한 장 만들어 S3 에 올리고 라이브러리에 추가합니다. 실패하면 None"""
+    try:
+        image_bytes = _generate_image_bytes(prompt_key)
+    except Exception as e:
+        print(f"Vertex AI image generation failed for prompt '{prompt_key}': {e}")
+        return None
+    if not image_bytes:
+        return None
+
+    # 내용 해시를 객체 이름으로 사용하므로, 같은 이미지는 같은 S3 객체를 가리킵니다.
+    style_version = settings.QUIZ_IMAGE_STYLE_VERSION
+    object_name = f"quiz-images/{style_version}/{prompt_key.replace(' ', '_')}/{hashlib.sha256(image_bytes).hexdigest()[:32]}.png"
+    image_url = upload_to_s3(image_bytes, settings.AWS_STORAGE_BUCKET_NAME, object_name)
+    if not image_url:
+        return None
+    return QuizImage.objects.create(prompt_key=prompt_key, style_version=style_version, image_url=image_url)
+
+def _add_library_image_in_thread(prompt_key):
+    try:
+        return add_library_image(prompt_key)
+    finally:
+        connections.close_all()  # 작업 스레드에서 열린 DB 연결 정리
+
+def get_image_pools(prompt_keys):
+    """{prompt_key: [image_url, ...]} (현재 스타일 버전만, 한 번의 조회)"""
+    pools = defaultdict(list)
+    rows = QuizImage.objects.filter(prompt_key__in=set(prompt_keys), style_version=settings.QUIZ_IMAGE_STYLE_VERSION).values_list('prompt_key', 'image_url')
+    for prompt_key, image_url in rows:
+        pools[prompt_key].append(image_url)
+    return pools
+
+def fill_pools(prompt_keys, target):
+    """풀의 이미지 수가 target 보다 적은 프롬프트만 부족한 만큼 생성합니다. 반환값: 새로 만든 이미지 수"""
+    pools = get_image_pools(prompt_keys)
+    jobs = [prompt_key for prompt_key in sorted(set(prompt_keys)) for _ in range(target - len(pools[prompt_key]))]
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        return sum(1 for image in executor.map(_add_library_image_in_thread, jobs) if image)
+
+def pick_quiz_images(prompts):
+    """
+    프롬프트마다 라이브러리에서 이미지 URL 을 하나씩 고릅니다. {prompt: image_url}
+    풀이 비어 있는 프롬프트만 그 자리에서 한 장 생성하고, 그래도 없는 프롬프트가 있으면 None 을 반환합니다.
+    """
+    prompt_keys = {prompt: normalize_prompt(prompt) for prompt in prompts}
+    pools = get_image_pools(prompt_keys.values())
+    empty = [prompt_key for prompt_key in set(prompt_keys.values()) if not pools[prompt_key]]
+    if empty:
+        fill_pools(empty, 1)
+        pools = get_image_pools(prompt_keys.values())
+    if not all(pools[prompt_key] for prompt_key in prompt_keys.values()):
+        return None
+    return {prompt: random.choice(pools[prompt_key]) for prompt, prompt_key in prompt_keys.items()}
+
+def top_up_pools(prompts):
+    """퀴즈 저장 후 호출: QUIZ_IMAGE_POOL_SIZE 보다 작은 풀만 채워서 다음 퀴즈의 이미지 다양성을 확보합니다."""
+    return fill_pools([normalize_prompt(prompt) for prompt in prompts], settings.QUIZ_IMAGE_POOL_SIZE)
@@ -0,0 +1,156 @@
+# games/rollup_utils.py
+
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Count, Sum, Case, When
+from django.utils import timezone
+
+from .models import GameSession, GameInteractionLog, GameDailyStat, to_local_date, extract_throw_power
+
+ROLLUP_COUNTERS = [
+    'attempts', 'successes',
+    'response_time_sum', 'response_time_count',
+    'throw_power_sum', 'throw_power_count',
+    'session_count', 'completed_session_count', 'play_seconds',
+]
+
+def empty_bucket():
+    return {field: 0 for field in ROLLUP_COUNTERS}
+
+def merge_bucket(target, source):
+    for key, value in source.items():
+        target[key] += value or 0
+
+def aggregate_logs(logs, *group_by):
+    """로그를 주어진 컬럼(예: 'local_date')으로 묶어 롤업 카운터를 SQL에서 집계합니다."""
+    return (
+        logs
+        .values(*group_by)
+        .annotate(
+            attempts=Count('log_id'),
+            successes=Count(Case(When(is_successful=True, then=1))),
+            response_time_sum=Sum('response_time_ms'),
+            response_time_count=Count('response_time_ms'),
+            throw_power_sum=Sum('throw_power'),
+            throw_power_count=Count('throw_power'),
+        )
+        .order_by()
+    )
+
+ROLLUP_KEY_FIELDS = ['user_id', 'game_id', 'local_date', 'assistance_level']
+
+def bump_daily_stat(user_id, game_id, date, assistance_level, **deltas):
+    """
+    롤업 행을 (없으면 만들고) F() 식으로 원자적으로 증감합니다.
+    대부분은 행이 이미 있으므로 UPDATE 한 번으로 끝나고, 처음 쓰는 버킷만 upsert 로 만든 뒤 다시 증감합니다.
+    (get_or_create 는 MySQL REPEATABLE READ 에서 동시에 같은 버킷을 만들면 IntegrityError 뒤의 get() 이 새 행을 보지 못해 실패합니다)
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    key = {'user_id': user_id, 'game_id': game_id, 'local_date': date, 'assistance_level': assistance_level or ''}
+    changes = {'updated_at': timezone.now(), **{field: F(field) + value for field, value in deltas.items()}}
+    if GameDailyStat.objects.filter(**key).update(**changes):
+        return
+    # MySQL 의 ON DUPLICATE KEY UPDATE 는 충돌 컬럼을 지정하지 않습니다.
+    unique_fields = ROLLUP_KEY_FIELDS if connection.features.supports_update_conflicts_with_target else None
+    GameDailyStat.objects.bulk_create([GameDailyStat(**key)], update_conflicts=True, update_fields=['updated_at'], unique_fields=unique_fields)
+    GameDailyStat.objects.filter(**key).update(**changes)
+
+# --- 쓰기 경로에서 호출되는 함수들 ---
+
+def record_session_start(session):
+    bump_daily_stat(session.user_id, session.game_id, session.local_date, session.assistance_level, session_count=1)
+
+def _log_counters(log):
+    return {
+        'attempts': 1,
+        'successes': 1 if log.is_successful else 0,
+        'response_time_sum': log.response_time_ms or 0,
+        'response_time_count': 1 if log.response_time_ms is not None else 0,
+        'throw_power_sum': log.throw_power or 0,
+        'throw_power_count': 1 if log.throw_power is not None else 0,
+    }
+
+def create_interaction_logs(items):
+    """
+    검증된 로그 데이터 목록을 bulk_create 로 한 번에 저장하고 롤업을 갱신합니다.
+    bulk_create 는 save()를 거치지 않으므로 세션 필드, local_date, throw_power 를 여기서 직접 채웁니다.
+    """
+    session_ids = {item['session_id'] for item in items}
+    sessions = {
+        row.pop('session_id'): row
+        for row in GameSession.objects.filter(session_id__in=session_ids).values('session_id', 'user_id', 'game_id', 'assistance_level')
+    }
+
+    logs = []
+    for item in items:
+        log = GameInteractionLog(**item, **sessions.get(item['session_id'], {}))
+        log.local_date = to_local_date(log.timestamp)
+        log.throw_power = extract_throw_power(log.interaction_data)
+        logs.append(log)
+    GameInteractionLog.objects.bulk_create(logs)
+
+    # 같은 버킷의 로그를 먼저 합쳐서, 롤업 행마다 UPDATE 를 한 번만 실행합니다.
+    # 존재하지 않는 세션의 로그(user_id 없음)는 통계에 포함되지 않으므로 롤업도 건너뜁니다.
+    buckets = defaultdict(dict)
+    for log in logs:
+        if log.user_id is None:
+            continue
+        bucket = buckets[(log.user_id, log.game_id, log.local_date, log.assistance_level or '')]
+        for field, value in _log_counters(log).items():
+            bucket[field] = bucket.get(field, 0) + value
+    for (user_id, game_id, date, level), deltas in buckets.items():
+        bump_daily_stat(user_id, game_id, date, level, **deltas)
+    return logs
+
+def record_session_end(session, previous_level):
+    """
+    세션 종료를 롤업에 반영합니다.
+    도움 수준은 종료 시점에 정해지므로, 진행 중에 '' 버킷에 쌓인 로그/세션 수를 새 수준 버킷으로 옮깁니다.
+    """
+    level = session.assistance_level or ''
+    previous_level = previous_level or ''
+    start_date = session.local_date
+    if level != previous_level:
+        for row in aggregate_logs(GameInteractionLog.objects.filter(session_id=session.session_id), 'local_date'):
+            date = row.pop('local_date')
+            bump_daily_stat(session.user_id, session.game_id, date, previous_level, **{k: -(v or 0) for k, v in row.items()})
+            bump_daily_stat(session.user_id, session.game_id, date, level, **row)
+        bump_daily_stat(session.user_id, session.game_id, start_date, previous_level, session_count=-1)
+        bump_daily_stat(session.user_id, session.game_id, start_date, level, session_count=1)
+    bump_daily_stat(
+        session.user_id, session.game_id, start_date, level,
+        completed_session_count=1,
+        play_seconds=(session.session_end_time - session.session_start_time).total_seconds(),
+    )
+
+# --- 원본 로그로부터 롤업을 다시 계산 (rebuild_daily_stats 커맨드) ---
+
+def compute_daily_buckets(user_id):
+    """원본 세션/로그를 (game_id, 날짜, assistance_level) 버킷으로 다시 집계합니다."""
+    buckets = defaultdict(empty_bucket)
+    # 필요한 컬럼만 values_list 로 가져오고 iterator 로 흘려보내서, 세션 수와 관계없이 메모리 사용량을 일정하게 유지합니다.
+    chunk_size = settings.STATS_ITERATOR_CHUNK_SIZE
+    sessions = GameSession.objects.filter(user_id=user_id).values_list('game_id', 'local_date', 'assistance_level', 'session_start_time', 'session_end_time')
+    for game_id, date, level, start_time, end_time in sessions.iterator(chunk_size=chunk_size):
+        bucket = buckets[(game_id, date, level or '')]
+        bucket['session_count'] += 1
+        if end_time is not None:
+            bucket['completed_session_count'] += 1
+            bucket['play_seconds'] += (end_time - start_time).total_seconds()
+
+    # 로그에 user_id/game_id/assistance_level 이 있으므로 세션 테이블 없이 한 번에 묶을 수 있습니다.
+    for row in aggregate_logs(GameInteractionLog.objects.filter(user_id=user_id), 'game_id', 'local_date', 'assistance_level').iterator(chunk_size=chunk_size):
+        merge_bucket(buckets[(row.pop('game_id'), row.pop('local_date'), row.pop('assistance_level') or '')], row)
+    return buckets
+
+def rebuild_user_daily_stats(user_id):
+    buckets = compute_daily_buckets(user_id)
+    GameDailyStat.objects.filter(user_id=user_id).delete()
+    GameDailyStat.objects.bulk_create([
+        GameDailyStat(user_id=user_id, game_id=game_id, local_date=date, assistance_level=level, **bucket)
+        for (game_id, date, level), bucket in buckets.items()
+    ])
+    return len(buckets)
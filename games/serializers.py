@@ -11,6 +11,8 @@ class GameInteractionLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = GameInteractionLog
         fields = '__all__'
+        # 세션/timestamp/interaction_data 에서 채워지는 비정규화 필드는 클라이언트가 보내지 않습니다.
+        read_only_fields = ['user_id', 'game_id', 'assistance_level', 'local_date', 'throw_power']
 
 # --- 각 게임별 종료 Serializer ---
 # 게임마다 포인트 변수명이 다르므로 별도로 정의합니다.
@@ -50,6 +52,10 @@ class QuizItemSerializer(serializers.Serializer):
 class QuizGenerationRequestSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
 
+class DeletePlayedQuizzesRequestSerializer(QuizGenerationRequestSerializer):
+    """quiz_ids 를 주면 그 퀴즈를, 없으면 조회 API 가 내준 가장 오래된 퀴즈 세트를 지웁니다."""
+    quiz_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
 class FirstGameQuizSerializer(serializers.ModelSerializer):
     class Meta:
         model = FirstGameQuiz
@@ -1,58 +1,80 @@
+import math
 import random
 import uuid
-import boto3
-from botocore.exceptions import NoCredentialsError
 from celery import shared_task
 from django.conf import settings
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
+from django.core.cache import cache
 
+from data.cache_utils import release_lock
 from .models import FirstGameQuiz
 from users.models import User
+from .quiz_images import pick_quiz_images, top_up_pools
+from Zerodose import metrics
 
-def upload_to_s3(image_bytes, bucket_name, object_name):
-    """S3에 이미지 바이트를 업로드하고 URL을 반환하는 함수"""
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME
-    )
+QUIZ_SET_SIZE = 3  # 게임 한 판에 사용하는 퀴즈 수
+QUIZ_REFILL_LOCK_ATTEMPTS = 3
+
+def _quiz_refill_key(user_id):
+    return f'quiz-pool-refill:{user_id}'
+
+def ready_quiz_count(user_id):
+    return FirstGameQuiz.objects.filter(user_id=user_id, is_ready=True).count()
+
+def get_quiz_refill_job_id(user_id):
+    """사용자의 대기/실행 중인 퀴즈 생성 작업 id. 없으면 None."""
+    return cache.get(_quiz_refill_key(user_id))
+
+def request_quiz_pool_refill(user_id, depth=None):
+    """
+    준비된 퀴즈가 QUIZ_POOL_LOW_WATERMARK 보다 적으면 Celery 로 채우기 작업을 넣습니다.
+    로그인/생성 요청/퀴즈 소비 등 모든 퀴즈 생성은 이 함수를 거치며, 사용자당 하나의 작업만 대기/실행되도록(single-flight)
+    캐시 잠금에 작업 id 를 저장합니다.
+    반환값: (job_id, created). 퀴즈가 충분하면 (None, False), 이미 실행 중이면 (기존 job_id, False)
+    """
+    if depth is None:
+        depth = ready_quiz_count(user_id)
+    if depth >= settings.QUIZ_POOL_LOW_WATERMARK:
+        return None, False
+    job_id = uuid.uuid4().hex
+    for _ in range(QUIZ_REFILL_LOCK_ATTEMPTS):
+        if cache.add(_quiz_refill_key(user_id), job_id, timeout=settings.QUIZ_POOL_REFILL_LOCK_TIMEOUT):
+            break
+        running_job_id = get_quiz_refill_job_id(user_id)
+        if running_job_id is not None:
+            return running_job_id, False
+        # add 와 get 사이에 잠금이 만료/해제된 경우 다시 잡습니다.
+    else:
+        return None, False
     try:
-        s3_client.put_object(Body=image_bytes, Bucket=bucket_name, Key=object_name, ContentType='image/png')
-        url = f"https://{bucket_name}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{object_name}"
-        return url
-    except NoCredentialsError:
-        print("S3 credentials not available")
-        return None
+        refill_quiz_pool.apply_async(args=(user_id,), task_id=job_id)
     except Exception as e:
-        print(f"S3 upload failed: {e}")
-        return None
+        cache.delete(_quiz_refill_key(user_id))
+        print(f"Quiz pool refill could not be queued for user {user_id}: {e}")
+        return None, False
+    metrics.incr('quiz_pool.refills')
+    return job_id, True
+
+def record_quiz_pool_request(user_id, depth):
+    """퀴즈 조회 시 풀 깊이/재고 없음 메트릭을 남기고, 낮은 워터마크 아래면 채우기를 요청합니다."""
+    metrics.incr('quiz_pool.requests')
+    metrics.incr('quiz_pool.depth_sum', depth)
+    if depth < QUIZ_SET_SIZE:
+        metrics.incr('quiz_pool.empty')
+    request_quiz_pool_refill(user_id, depth)
+
+@shared_task(bind=True, acks_late=True)
+def refill_quiz_pool(self, user_id):
+    """준비된 퀴즈가 QUIZ_POOL_HIGH_WATERMARK 에 도달할 때까지 퀴즈 세트를 만드는 Celery Task"""
+    from .views import create_quiz_set  # views 가 이 모듈을 import 하므로 순환 import 를 피합니다.
 
-def generate_image_with_vertex_ai(prompt: str) -> str:
-    """Vertex AI Imagen을 호출하여 이미지를 생성하고 S3에 업로드 후 URL을 반환하는 함수"""
     try:
-        vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
-        model = ImageGenerationModel.from_pretrained("imagegeneration@005")
-        
-        # 프롬프트를 단순하고 직접적으로 유지
-        detailed_prompt = f"A simple cartoon of a {prompt}, on a clean white background, for children's learning"
-        
-        images = model.generate_images(
-            prompt=detailed_prompt,
-            number_of_images=1,
-            negative_prompt="text, words, realistic, photo, scary, complex, multiple objects"
-        )
-        
-        image_bytes = images[0]._image_bytes
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        object_name = f"quiz-images/{prompt.replace(' ', '_')}_{uuid.uuid4().hex}.png"
-        
-        image_url = upload_to_s3(image_bytes, bucket_name, object_name)
-        return image_url
-    except Exception as e:
-        print(f"Vertex AI image generation failed for prompt '{prompt}': {e}")
-        return None
+        depth = ready_quiz_count(user_id)
+        for _ in range(math.ceil(max(settings.QUIZ_POOL_HIGH_WATERMARK - depth, 0) / QUIZ_SET_SIZE)):
+            if not create_quiz_set(user_id):
+                break
+        return f"User {user_id} 퀴즈 풀: {depth}개 -> {ready_quiz_count(user_id)}개"
+    finally:
+        release_lock(_quiz_refill_key(user_id), self.request.id)
 
 @shared_task
 def generate_quiz_set_for_user(user_id):
@@ -74,6 +96,8 @@ def generate_quiz_set_for_user(user_id):
             {"prompt": "🐶 갈색 강아지는 어디 있지?", "correct": "강아지", "color": "갈색", "wrong": ["바나나", "사과"]},
         ]
 
+        quiz_data_list = []
+        prompts_to_generate = []
         for _ in range(3):
             sample = random.choice(quiz_samples)
             
@@ -85,28 +109,33 @@ def generate_quiz_set_for_user(user_id):
             wrong_prompt_1 = item_translation[wrong_items_names[0]]
             wrong_prompt_2 = item_translation[wrong_items_names[1]]
 
-            correct_item_url = generate_image_with_vertex_ai(correct_prompt)
-            wrong_item_1_url = generate_image_with_vertex_ai(wrong_prompt_1)
-            wrong_item_2_url = generate_image_with_vertex_ai(wrong_prompt_2)
-            
-            if not all([correct_item_url, wrong_item_1_url, wrong_item_2_url]):
-                print(f"User {user_id}의 퀴즈 이미지 생성 중 하나 이상 실패")
-                continue
+            quiz_data_list.append((sample, correct_prompt, wrong_prompt_1, wrong_prompt_2))
+            prompts_to_generate.extend([correct_prompt, wrong_prompt_1, wrong_prompt_2])
 
+        # 이미지 라이브러리에서 고르고, 비어 있는 풀만 바로 생성합니다.
+        image_urls = pick_quiz_images(prompts_to_generate)
+        if image_urls is None:
+            return f"User {user_id}의 퀴즈 이미지 생성 중 하나 이상 실패"
+
+        quizzes = []
+        for sample, correct_prompt, wrong_prompt_1, wrong_prompt_2 in quiz_data_list:
             items_list = [
-                {"name": correct_item_name, "image_url": correct_item_url},
-                {"name": wrong_items_names[0], "image_url": wrong_item_1_url},
-                {"name": wrong_items_names[1], "image_url": wrong_item_2_url},
+                {"name": sample["correct"], "image_url": image_urls[correct_prompt]},
+                {"name": sample["wrong"][0], "image_url": image_urls[wrong_prompt_1]},
+                {"name": sample["wrong"][1], "image_url": image_urls[wrong_prompt_2]},
             ]
             random.shuffle(items_list)
-
-            FirstGameQuiz.objects.create(
+            quizzes.append(FirstGameQuiz(
                 user=user,
                 prompt_text=sample["prompt"],
                 items=items_list,
-                correct_answer=correct_item_name,
+                correct_answer=sample["correct"],
                 is_ready=True
-            )
-        return f"User {user_id}를 위한 Vertex AI 퀴즈 3개 생성 완료"
+            ))
+        FirstGameQuiz.objects.bulk_create(quizzes)
+
+        # 퀴즈 저장 후에 부족한 풀만 채웁니다.
+        top_up_pools(prompts_to_generate)
+        return f"User {user_id}를 위한 퀴즈 3개 생성 완료"
     except User.DoesNotExist:
         return f"User {user_id}를 찾을 수 없음"
\ No newline at end of file
@@ -1,3 +1,392 @@
-from django.test import TestCase
+import io
+import re
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from users.models import User
+from data.management.commands.run_nightly_analysis import users_needing_analysis
+from data.rl_utils import get_user_state, calculate_reward_and_next_state
+from .management.commands.check_query_plans import explain_sql, full_scan_tables
+from .models import GameDailyStat, GameInteractionLog, GameSession, FirstGameQuiz, QuizImage, extract_throw_power
+from .quiz_images import get_image_pools, pick_quiz_images, top_up_pools
+from .rollup_utils import ROLLUP_COUNTERS, bump_daily_stat, rebuild_user_daily_stats
+from .task import _quiz_refill_key, refill_quiz_pool
+
+# 테스트는 Redis 없이 실행되도록 프로세스 메모리 캐시를 사용합니다.
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+END_SESSION_URLS = {
+    1: ('/api/games/first-game/session/end/', 'correct_answers'),
+    2: ('/api/games/second-game/session/end/', 'completed_count'),
+    3: ('/api/games/third-game/session/end/', 'successful_throws'),
+}
+
+class GamePlayMixin:
+    """게임 API(세션 시작/로그/배치 로그/세션 종료)를 실제 요청으로 호출하는 테스트 도우미"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='child')
+
+    def start(self, game_id):
+        response = self.client.post('/api/games/session/start/', {'user_id': self.user.user_id, 'game_id': game_id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['session_id']
+
+    def log_item(self, session_id, is_successful, response_time_ms=None, days_ago=0, **interaction_data):
+        return {
+            'session_id': session_id,
+            'is_successful': is_successful,
+            'response_time_ms': response_time_ms,
+            'interaction_data': interaction_data,
+            'timestamp': (timezone.now() - timedelta(days=days_ago)).isoformat(),
+        }
+
+    def log(self, session_id, is_successful, **kwargs):
+        response = self.client.post('/api/games/interaction/log/', self.log_item(session_id, is_successful, **kwargs), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def log_batch(self, items):
+        response = self.client.post('/api/games/interaction/log/batch/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def end(self, game_id, session_id, assistance_level, score=1):
+        url, score_field = END_SESSION_URLS[game_id]
+        data = {'session_id': session_id, score_field: score, 'assistance_level': assistance_level}
+        if game_id == 1:
+            data['quiz_ids'] = []
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def play_sample_games(self):
+        """세 게임에 걸쳐 단건/배치 로그, 지난 날짜 로그, 종료/미종료 세션을 모두 만듭니다."""
+        g1 = self.start(1)
+        self.log(g1, True, response_time_ms=1200)
+        self.log(g1, False, response_time_ms=3400)
+        self.log(g1, True)
+        self.end(1, g1, 'VERBAL', score=2)
+
+        g2 = self.start(2)
+        self.log_batch([
+            self.log_item(g2, True, response_time_ms=800),
+            self.log_item(g2, True, response_time_ms=950, days_ago=1),
+        ])
+        self.end(2, g2, 'NONE')
+
+        g3 = self.start(3)
+        self.log_batch([
+            self.log_item(g3, True, response_time_ms=500, throw_power=62.5),
+            self.log_item(g3, False, throw_power=40),
+            self.log_item(g3, True, days_ago=2, throw_power=71),
+            self.log_item(g3, False, days_ago=2),
+        ])
+        self.log(g3, True, throw_power=55.5)
+        self.end(3, g3, 'PHYSICAL', score=2)
+
+        # 아직 끝나지 않은 세션은 '' 버킷에 남습니다.
+        open_g3 = self.start(3)
+        self.log(open_g3, False, response_time_ms=700, throw_power=30)
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GameDailyStatRollupTests(GamePlayMixin, TestCase):
+    """쓰기 경로에서 증분으로 갱신한 GameDailyStat 이 원본 로그로 다시 계산한 결과와 같은지 확인합니다."""
+
+    def rollup_snapshot(self):
+        rows = GameDailyStat.objects.filter(user_id=self.user.user_id).values_list('game_id', 'local_date', 'assistance_level', *ROLLUP_COUNTERS)
+        # 세션 종료 시 다른 수준으로 옮기고 남은 0 행은 rebuild 에서는 만들어지지 않으므로 비교에서 제외합니다.
+        return {
+            (game_id, date, level): tuple(round(value, 6) for value in counters)
+            for game_id, date, level, *counters in rows if any(counters)
+        }
+
+    def assertRollupMatchesRebuild(self):
+        incremental = self.rollup_snapshot()
+        self.assertTrue(incremental)
+        rebuild_user_daily_stats(self.user.user_id)
+        self.assertEqual(incremental, self.rollup_snapshot())
+
+    def test_single_logs_and_session_end(self):
+        session_id = self.start(1)
+        self.log(session_id, True, response_time_ms=1000)
+        self.log(session_id, False, response_time_ms=2500, days_ago=1)
+        self.end(1, session_id, 'VERBAL')
+        self.assertRollupMatchesRebuild()
+
+    def test_batch_logs_with_throw_power(self):
+        session_id = self.start(3)
+        self.log_batch([
+            self.log_item(session_id, True, throw_power=80),
+            self.log_item(session_id, False, response_time_ms=600, throw_power=20.5),
+            self.log_item(session_id, True, days_ago=3),
+        ])
+        self.end(3, session_id, 'PHYSICAL')
+        self.assertRollupMatchesRebuild()
+
+    def test_session_end_without_assistance_level(self):
+        session_id = self.start(2)
+        self.log(session_id, True, response_time_ms=900)
+        self.end(2, session_id, '')
+        self.assertRollupMatchesRebuild()
+
+    def test_open_session_and_unknown_session_logs(self):
+        session_id = self.start(1)
+        self.log(session_id, True, response_time_ms=1100)
+        # 존재하지 않는 세션의 로그는 저장되지만 통계에는 포함되지 않습니다.
+        self.log(999999, True, response_time_ms=1100)
+        self.assertRollupMatchesRebuild()
+
+    def test_sample_games(self):
+        self.play_sample_games()
+        self.assertRollupMatchesRebuild()
+
+    def test_bucket_created_by_a_concurrent_request(self):
+        key = {'user_id': self.user.user_id, 'game_id': 1, 'local_date': timezone.now().date(), 'assistance_level': ''}
+        original_update = QuerySet.update
+
+        def update(queryset, **kwargs):
+            # 첫 UPDATE 가 행을 못 찾은 직후 다른 요청이 같은 버킷을 만든 경우
+            if queryset.model is GameDailyStat and not GameDailyStat.objects.filter(**key).exists():
+                GameDailyStat.objects.create(**key, attempts=5)
+                return 0
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update):
+            bump_daily_stat(self.user.user_id, 1, key['local_date'], None, attempts=1)
+        self.assertEqual(GameDailyStat.objects.get(**key).attempts, 6)
+
+class BackfillInteractionLogsTests(TestCase):
+    """backfill_interaction_logs 의 throw_power 는 쓰기 경로(extract_throw_power)와 같은 값이어야 합니다."""
+
+    def test_throw_power_matches_write_path(self):
+        session = GameSession.objects.create(user_id=1, game_id=3)
+        interaction_data = [{'throw_power': 40}, {'throw_power': 62.5}, {'throw_power': '55.5'}, {'throw_power': 'strong'}, {'throw_power': None}, {}]
+        GameInteractionLog.objects.bulk_create([
+            GameInteractionLog(session_id=session.session_id, is_successful=True, interaction_data=data)
+            for data in interaction_data
+        ])
+        call_command('backfill_interaction_logs', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(
+            list(GameInteractionLog.objects.order_by('log_id').values_list('throw_power', flat=True)),
+            [extract_throw_power(data) for data in interaction_data],
+        )
+        self.assertEqual([extract_throw_power(data) for data in interaction_data], [40.0, 62.5, None, None, None, None])
+
+EXPLAINABLE_SQL = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+@override_settings(CACHES=LOCMEM_CACHES, QUIZ_POOL_LOW_WATERMARK=0)
+class QueryPlanTests(GamePlayMixin, TestCase):
+    """
+    뷰를 실제로 호출하면서 실행된 SQL 을 모아 EXPLAIN 하고, 전체 테이블 스캔이 없는지 확인합니다.
+    (QUIZ_POOL_LOW_WATERMARK=0: 퀴즈 풀 채우기 작업을 큐에 넣지 않도록)
+    """
+
+    def assertNoFullScans(self, captured, allowed_tables=()):
+        failures = []
+        for query in captured.captured_queries:
+            if not EXPLAINABLE_SQL.match(query['sql']):
+                continue
+            tables = set(full_scan_tables(explain_sql(query['sql']))) - set(allowed_tables)
+            if tables:
+                failures.append(f"{', '.join(sorted(tables))}: {query['sql']}")
+        self.assertEqual(failures, [])
+
+    def post(self, url, data):
+        response = self.client.post(url, data, format='json')
+        self.assertLess(response.status_code, 500)
+        return response
+
+    def test_game_write_paths(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.play_sample_games()
+        self.assertNoFullScans(captured)
+
+    def test_stats_and_quiz_read_paths(self):
+        self.play_sample_games()
+        FirstGameQuiz.objects.create(user=self.user, prompt_text='Where is the apple?', items=[], correct_answer='사과', is_ready=True)
+        session_id = self.start(3)
+        self.log(session_id, True, throw_power=50)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as captured:
+            cursor = self.post('/api/data/user-stats/', {'user_id': self.user.user_id}).data['cursor']
+            self.post('/api/data/user-stats/', {'user_id': self.user.user_id, 'since': cursor})
+            self.post('/api/data/user-stats/batch/', {'user_ids': [self.user.user_id, self.user.user_id + 1]})
+            get_user_state(self.user.user_id)
+            calculate_reward_and_next_state(session_id)
+            get_image_pools(['apple', 'red apple'])
+            self.post('/api/games/firstgame/get-quizzes/', {'user_id': self.user.user_id})
+            self.post('/api/games/firstgame/get-or-wait-quizzes/', {'user_id': self.user.user_id})
+            self.post('/api/games/firstgame/delete-latest-quizzes/', {'user_id': self.user.user_id})
+        self.assertNoFullScans(captured)
+
+    def test_nightly_analysis_candidates(self):
+        self.play_sample_games()
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(list(users_needing_analysis()), [self.user.user_id])
+        # 전체 사용자를 훑는 배치이므로 users 스캔은 허용하고, 사용자별 롤업 서브쿼리만 확인합니다.
+        self.assertNoFullScans(captured, allowed_tables={'users'})
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuizRefillLockTests(TestCase):
+    """퀴즈 풀 채우기 작업은 자기 작업 id 로 잡힌 잠금만 해제합니다."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='child')
+        patcher = mock.patch('games.views.create_quiz_set', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_task(self, task_id):
+        # apply() 는 결과 백엔드(Redis)에 기록하므로 작업 본문만 작업 id 와 함께 실행합니다.
+        refill_quiz_pool.push_request(id=task_id)
+        try:
+            refill_quiz_pool.run(self.user.user_id)
+        finally:
+            refill_quiz_pool.pop_request()
+
+    def test_releases_own_lock(self):
+        cache.set(_quiz_refill_key(self.user.user_id), 'job-1')
+        self.run_task('job-1')
+        self.assertIsNone(cache.get(_quiz_refill_key(self.user.user_id)))
+
+    def test_keeps_lock_taken_by_newer_job(self):
+        # 잠금이 만료된 뒤 새 작업이 잠금을 잡았다면 이전 작업이 끝나도 남아 있어야 합니다.
+        cache.set(_quiz_refill_key(self.user.user_id), 'job-2')
+        self.run_task('job-1')
+        self.assertEqual(cache.get(_quiz_refill_key(self.user.user_id)), 'job-2')
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuizPoolTests(TestCase):
+    """퀴즈 조회/삭제 API 와 풀 채우기 요청"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='child')
+        patcher = mock.patch('games.task.refill_quiz_pool.apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_quizzes(self, count):
+        now = timezone.now()
+        quizzes = FirstGameQuiz.objects.bulk_create([
+            FirstGameQuiz(user=self.user, prompt_text=f'q{index}', items=[], correct_answer='사과', is_ready=True)
+            for index in range(count)
+        ])
+        for index, quiz in enumerate(quizzes):
+            FirstGameQuiz.objects.filter(pk=quiz.pk).update(created_at=now - timedelta(minutes=count - index))
+        return quizzes
+
+    def served_prompts(self):
+        response = self.client.post('/api/games/firstgame/get-quizzes/', {'user_id': self.user.user_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [quiz['prompt_text'] for quiz in response.data]
+
+    def test_delete_removes_the_served_set(self):
+        self.create_quizzes(12)
+        self.assertEqual(self.served_prompts(), ['q0', 'q1', 'q2'])
+        response = self.client.post('/api/games/firstgame/delete-latest-quizzes/', {'user_id': self.user.user_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.served_prompts(), ['q3', 'q4', 'q5'])
+        self.assertEqual(FirstGameQuiz.objects.filter(user=self.user).count(), 9)
+
+    def test_delete_given_quiz_ids(self):
+        quizzes = self.create_quizzes(12)
+        response = self.client.post('/api/games/firstgame/delete-latest-quizzes/', {'user_id': self.user.user_id, 'quiz_ids': [quizzes[1].pk, quizzes[4].pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.served_prompts(), ['q0', 'q2', 'q3'])
+
+    def login(self):
+        response = self.client.post('/api/users/login/', {'username': 'child', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def trigger(self):
+        # 작업 상태 조회는 결과 백엔드(Redis)를 읽으므로 대신합니다.
+        with mock.patch('games.views.AsyncResult', return_value=mock.Mock(state='PENDING')):
+            return self.client.post('/api/games/firstgame/trigger-generation/', {'user_id': self.user.user_id}, format='json')
+
+    def test_login_and_trigger_enqueue_one_job(self):
+        User.objects.filter(pk=self.user.pk).update(password='secret')
+        self.login()
+        self.login()
+        first, second = self.trigger(), self.trigger()
+        self.assertEqual(self.apply_async.call_count, 1)
+        job_id = self.apply_async.call_args.kwargs['task_id']
+        self.assertEqual(cache.get(_quiz_refill_key(self.user.user_id)), job_id)
+        self.assertEqual((first.status_code, first.data['job_id']), (202, job_id))
+        self.assertEqual((second.status_code, second.data['job_id']), (202, job_id))
+
+    @override_settings(QUIZ_POOL_LOW_WATERMARK=6)
+    def test_no_job_when_pool_is_at_low_watermark(self):
+        User.objects.filter(pk=self.user.pk).update(password='secret')
+        self.create_quizzes(6)
+        self.login()
+        response = self.trigger()
+        self.assertEqual((response.status_code, response.data['job_id']), (200, None))
+        self.apply_async.assert_not_called()
+
+    def test_lock_released_between_add_and_get_is_taken_again(self):
+        with mock.patch('games.task.cache') as task_cache:
+            task_cache.add.side_effect = [False, True]
+            task_cache.get.return_value = None
+            response = self.trigger()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job_id'], self.apply_async.call_args.kwargs['task_id'])
+
+@override_settings(QUIZ_IMAGE_POOL_SIZE=3, QUIZ_IMAGE_STYLE_VERSION='v1')
+class QuizImageLibraryTests(TransactionTestCase):
+    """
+    퀴즈 이미지는 라이브러리에서 고르고, 비어 있거나 모자란 풀만 Vertex AI 로 생성합니다.
+    (이미지는 작업 스레드에서 저장되므로 테스트 트랜잭션 밖에서 실행합니다)
+    """
+
+    def setUp(self):
+        self.imagen = mock.Mock()
+        self.imagen.generate_images.side_effect = lambda prompt, **kwargs: [mock.Mock(_image_bytes=prompt.encode() + str(self.imagen.generate_images.call_count).encode())]
+        for target, value in [('get_client', {'return_value': self.imagen}), ('upload_to_s3', {'side_effect': lambda data, bucket, name: f'https://s3.test/{name}'})]:
+            patcher = mock.patch(f'games.quiz_images.{target}', **value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add_images(self, prompt_key, count):
+        QuizImage.objects.bulk_create([QuizImage(prompt_key=prompt_key, style_version='v1', image_url=f'https://s3.test/{prompt_key}/{index}') for index in range(count)])
+
+    def pool_sizes(self):
+        return {prompt_key: len(urls) for prompt_key, urls in get_image_pools(['red apple', 'car', 'duck']).items()}
+
+    def test_pick_generates_only_for_empty_pools(self):
+        self.add_images('car', 2)
+        # 이전 스타일 버전 이미지는 쓰지 않습니다.
+        QuizImage.objects.create(prompt_key='duck', style_version='v0', image_url='https://s3.test/old-duck')
+
+        image_urls = pick_quiz_images(['red apple', 'Car', 'duck'])
+        self.assertEqual(self.imagen.generate_images.call_count, 2)
+        self.assertEqual(set(image_urls), {'red apple', 'Car', 'duck'})
+        self.assertIn(image_urls['Car'], {'https://s3.test/car/0', 'https://s3.test/car/1'})
+        self.assertEqual(self.pool_sizes(), {'red apple': 1, 'car': 2, 'duck': 1})
+
+        # 풀이 채워진 뒤에는 Vertex AI 를 호출하지 않습니다.
+        pick_quiz_images(['red apple', 'car', 'duck'])
+        self.assertEqual(self.imagen.generate_images.call_count, 2)
+
+    def test_pick_fails_when_generation_fails(self):
+        self.imagen.generate_images.side_effect = RuntimeError('quota exceeded')
+        self.assertIsNone(pick_quiz_images(['red apple']))
+
+    def test_top_up_stops_at_pool_size(self):
+        self.add_images('red apple', 1)
+        self.add_images('car', 3)
+        self.assertEqual(top_up_pools(['red apple', 'car', 'duck']), 5)
+        self.assertEqual(self.pool_sizes(), {'red apple': 3, 'car': 3, 'duck': 3})
+        self.assertEqual(top_up_pools(['red apple', 'car', 'duck']), 0)
+        self.assertEqual(self.imagen.generate_images.call_count, 5)
@@ -8,6 +8,7 @@ urlpatterns = [
     # 공용 API 경로
     path('session/start/', StartGameSessionView.as_view()),
     path('interaction/log/', LogGameInteractionView.as_view()),
+    path('interaction/log/batch/', LogGameInteractionBatchView.as_view()),
 
     # 각 게임별 종료 API 경로
     path('first-game/session/end/', EndFirstGameSessionView.as_view()),
@@ -2,48 +2,24 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import random
-import uuid
-import boto3
-from botocore.exceptions import NoCredentialsError
-import threading 
 from django.conf import settings
-import vertexai
-from vertexai.preview.vision_models import ImageGenerationModel
 from django.db import transaction
 from django.utils import timezone
 from users.models import User
 from .models import GameSession, GameInteractionLog, FirstGameQuiz
 from .serializers import *
-import concurrent.futures # 멀티 스레딩을 위한 라이브러리 import
-
-def upload_to_s3(image_bytes, bucket_name, object_name):
-    s3_client = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID, aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY, region_name=settings.AWS_S3_REGION_NAME)
-    try:
-        s3_client.put_object(Body=image_bytes, Bucket=bucket_name, Key=object_name, ContentType='image/png')
-        url = f"https://{bucket_name}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{object_name}"
-        return url
-    except Exception as e:
-        print(f"S3 upload failed: {e}")
-        return None
-
-def generate_image_with_vertex_ai(prompt: str) -> str:
-    try:
-        vertexai.init(project=settings.GCP_PROJECT_ID, location=settings.GCP_LOCATION)
-        model = ImageGenerationModel.from_pretrained("imagegeneration@005")
-        detailed_prompt = f"A simple cartoon of a {prompt}, white background"
-        images = model.generate_images(prompt=detailed_prompt, number_of_images=1, negative_prompt="text, words, realistic, photo, scary, complex, multiple objects")
-        if not images:
-            return None
-        image_bytes = images[0]._image_bytes
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        object_name = f"quiz-images/{prompt.replace(' ', '_')}_{uuid.uuid4().hex}.png"
-        return upload_to_s3(image_bytes, bucket_name, object_name)
-    except Exception as e:
-        print(f"Vertex AI image generation failed for prompt '{prompt}': {e}")
-        return None
+from .rollup_utils import create_interaction_logs, record_session_start, record_session_end
+from data.cache_utils import bump_stats_version
+from .quiz_images import pick_quiz_images, top_up_pools
+from .task import QUIZ_SET_SIZE, ready_quiz_count, request_quiz_pool_refill, record_quiz_pool_request
+from Zerodose.celery import app as celery_app
+from celery.result import AsyncResult
 
 def create_quiz_set(user_id):
-    """AI를 사용하여 퀴즈 3개를 생성하고 DB에 저장하는 함수 (백그라운드 실행용)"""
+    """
+    퀴즈 3개를 만들어 DB에 저장하는 함수 (백그라운드 실행용). 반환값: 만든 퀴즈 수
+    이미지는 퀴즈 이미지 라이브러리에서 고르고, 퀴즈를 저장한 뒤에 부족한 풀만 Vertex AI 로 채웁니다.
+    """
     try:
         user = User.objects.get(pk=user_id)
         prompts_to_generate = []
@@ -66,51 +42,81 @@ def create_quiz_set(user_id):
             prompts_to_generate.append(quiz_data["correct_prompt"])
             prompts_to_generate.extend(quiz_data["wrong_prompts"])
 
-        image_urls = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            results = executor.map(generate_image_with_vertex_ai, prompts_to_generate)
-            image_urls = list(results)
-        
-        if not all(image_urls):
+        image_urls = pick_quiz_images(prompts_to_generate)
+        if image_urls is None:
             print(f"User {user_id}의 이미지 생성 중 일부 실패")
-            return
+            return 0
 
-        url_index = 0
+        quizzes = []
         for quiz_info in quiz_data_list:
             items = [
-                {"name": quiz_info["correct_answer"], "image_url": image_urls[url_index]},
-                {"name": quiz_info["wrong_names"][0], "image_url": image_urls[url_index + 1]},
-                {"name": quiz_info["wrong_names"][1], "image_url": image_urls[url_index + 2]},
+                {"name": quiz_info["correct_answer"], "image_url": image_urls[quiz_info["correct_prompt"]]},
+                {"name": quiz_info["wrong_names"][0], "image_url": image_urls[quiz_info["wrong_prompts"][0]]},
+                {"name": quiz_info["wrong_names"][1], "image_url": image_urls[quiz_info["wrong_prompts"][1]]},
             ]
             random.shuffle(items)
-            url_index += 3
-            FirstGameQuiz.objects.create(
+            quizzes.append(FirstGameQuiz(
                 user=user,
                 prompt_text=quiz_info["prompt_text"],
                 items=items,
                 correct_answer=quiz_info["correct_answer"],
                 is_ready=True
-            )
+            ))
+        FirstGameQuiz.objects.bulk_create(quizzes)
         print(f"User {user_id}를 위한 퀴즈 3개 백그라운드 생성 완료")
+
+        # 퀴즈는 이미 준비되었으므로, 이미지 다양성을 위한 풀 채우기는 그 뒤에 합니다.
+        top_up_pools(prompts_to_generate)
+        return len(quizzes)
     except Exception as e:
         print(f"Quiz generation task error for user {user_id}: {e}")
+        return 0
 
 class StartGameSessionView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = GameSessionCreateSerializer(data=request.data)
         if serializer.is_valid():
-            game_session = serializer.save()
+            with transaction.atomic():
+                game_session = serializer.save()
+                record_session_start(game_session)
+                transaction.on_commit(lambda: bump_stats_version(game_session.user_id))
             return Response({'session_id': game_session.session_id}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _bump_stats_versions_on_commit(logs):
+    user_ids = {log.user_id for log in logs if log.user_id is not None}
+    transaction.on_commit(lambda: [bump_stats_version(user_id) for user_id in user_ids])
+
 class LogGameInteractionView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = GameInteractionLogSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                logs = create_interaction_logs([serializer.validated_data])
+                _bump_stats_versions_on_commit(logs)
             return Response({'message': 'Log saved successfully.'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class LogGameInteractionBatchView(APIView):
+    """
+    여러 개의 상호작용 로그를 한 번의 요청으로 저장하는 API (요청 본문: 로그 객체 배열)
+    하나라도 유효하지 않으면 아무것도 저장하지 않고, 항목별 에러를 요청 순서대로 반환합니다.
+    """
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({"error": "Request body must be a non-empty JSON array of logs."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > settings.INTERACTION_LOG_BATCH_MAX_SIZE:
+            return Response({"error": f"A batch can contain at most {settings.INTERACTION_LOG_BATCH_MAX_SIZE} logs."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = GameInteractionLogSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            logs = create_interaction_logs(serializer.validated_data)
+            _bump_stats_versions_on_commit(logs)
+        return Response({'message': f'{len(logs)} logs saved successfully.', 'saved_count': len(logs)}, status=status.HTTP_201_CREATED)
+
 class BaseEndGameSessionView(APIView):
     serializer_class = None
     score_field_name = ''
@@ -129,13 +135,17 @@ class BaseEndGameSessionView(APIView):
 
         try:
             with transaction.atomic():
-                game_session = GameSession.objects.get(pk=session_id)
+                game_session = GameSession.objects.select_for_update().get(pk=session_id)
                 if game_session.session_end_time is not None:
                     return Response({"message": "Session has already ended."}, status=status.HTTP_400_BAD_REQUEST)
 
+                previous_level = game_session.assistance_level
                 game_session.session_end_time = timezone.now()
                 game_session.assistance_level = assistance_level
                 game_session.save(update_fields=['session_end_time', 'assistance_level'])
+                GameInteractionLog.objects.filter(session_id=session_id).update(assistance_level=assistance_level)
+                record_session_end(game_session, previous_level)
+                transaction.on_commit(lambda: bump_stats_version(game_session.user_id))
 
                 if score > 0:
                     user = User.objects.get(pk=game_session.user_id)
@@ -161,6 +171,8 @@ class EndFirstGameSessionView(BaseEndGameSessionView):
                 session = GameSession.objects.get(pk=request.data.get('session_id'))
                 user_id = session.user_id
                 FirstGameQuiz.objects.filter(quiz_id__in=quiz_ids, user_id=user_id).delete()
+                # 사용한 퀴즈를 지웠으므로 풀이 낮은 워터마크 아래로 내려가면 미리 채웁니다.
+                request_quiz_pool_refill(user_id)
             except GameSession.DoesNotExist:
                 # 세션을 못찾아도 일단 다음 로직은 실행되도록 함
                 pass
@@ -188,9 +200,21 @@ class TriggerQuizGenerationView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         user_id = serializer.validated_data['user_id']
-        thread = threading.Thread(target=create_quiz_set, args=(user_id,))
-        thread.start()
-        return Response({"message": "Quiz generation started in the background."}, status=status.HTTP_202_ACCEPTED)
+        depth = ready_quiz_count(user_id)
+        job_id, created = request_quiz_pool_refill(user_id, depth)
+        if job_id is None:
+            if depth >= settings.QUIZ_POOL_LOW_WATERMARK:
+                return Response({"message": "Enough quizzes are already ready.", "job_id": None, "ready_count": depth}, status=status.HTTP_200_OK)
+            return Response({"error": "Quiz generation could not be started."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # 이미 실행 중인 생성 작업이 있으면 새로 시작하지 않고 그 작업의 상태를 돌려줍니다.
+        message = "Quiz generation started in the background." if created else "Quiz generation is already in progress."
+        return Response({
+            "message": message,
+            "job_id": job_id,
+            "state": AsyncResult(job_id, app=celery_app).state,
+            "ready_count": depth,
+        }, status=status.HTTP_202_ACCEPTED)
 
 class GetReadyQuizzesView(APIView):
     """미리 생성된 퀴즈 3개를 DB에서 가져와 반환하는 API (삭제 로직 제거)"""
@@ -200,9 +224,12 @@ class GetReadyQuizzesView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         user_id = serializer.validated_data['user_id']
         
-        quizzes_to_play = FirstGameQuiz.objects.filter(user_id=user_id, is_ready=True).order_by('created_at')[:3]
+        ready_quizzes = FirstGameQuiz.objects.filter(user_id=user_id, is_ready=True)
+        depth = ready_quizzes.count()
+        record_quiz_pool_request(user_id, depth)
+        quizzes_to_play = ready_quizzes.order_by('created_at')[:QUIZ_SET_SIZE]
 
-        if quizzes_to_play.count() < 3:
+        if depth < QUIZ_SET_SIZE:
             return Response({"error": "Quizzes are not ready yet. Please try again in a moment."}, status=status.HTTP_404_NOT_FOUND)
         
         # 퀴즈를 반환하기만 하고, 삭제하지 않음
@@ -211,22 +238,25 @@ class GetReadyQuizzesView(APIView):
     
 class DeleteLatestQuizzesView(APIView):
     """
-    게임 종료 후, 가장 최근에 생성된 (사용하지 않은) 퀴즈 3개를 삭제하는 API
+    게임 종료 후, 방금 플레이한 퀴즈 세트를 삭제하는 API
+    조회 API 는 가장 오래된 퀴즈부터 내주므로 quiz_ids 가 없으면 가장 오래된 준비된 퀴즈 3개를 지웁니다.
+    (최신 퀴즈를 지우면 아직 안 푼 재고만 사라지고 같은 퀴즈가 계속 나옵니다)
     """
     def post(self, request, *args, **kwargs):
-        serializer = QuizGenerationRequestSerializer(data=request.data)
+        serializer = DeletePlayedQuizzesRequestSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         user_id = serializer.validated_data['user_id']
 
         try:
-            # --- 핵심 수정: 슬라이싱된 쿼리셋을 삭제하는 올바른 방법 ---
-            # 1. 삭제할 퀴즈들의 ID 목록을 먼저 가져옴
-            latest_quizzes_ids = list(FirstGameQuiz.objects.filter(user_id=user_id).order_by('-created_at')[:3].values_list('quiz_id', flat=True))
-            
-            # 2. ID 목록을 사용하여 해당 퀴즈들을 삭제
-            if latest_quizzes_ids:
-                FirstGameQuiz.objects.filter(quiz_id__in=latest_quizzes_ids).delete()
+            # 슬라이싱된 쿼리셋은 delete() 할 수 없으므로 ID 목록을 먼저 가져옵니다.
+            played_quiz_ids = serializer.validated_data.get('quiz_ids')
+            if played_quiz_ids is None:
+                played_quiz_ids = list(FirstGameQuiz.objects.filter(user_id=user_id, is_ready=True).order_by('created_at')[:QUIZ_SET_SIZE].values_list('quiz_id', flat=True))
+
+            if played_quiz_ids:
+                FirstGameQuiz.objects.filter(quiz_id__in=played_quiz_ids, user_id=user_id).delete()
+                request_quiz_pool_refill(user_id)
 
             return Response({"message": "Cleaned up latest quizzes successfully."}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -250,9 +280,12 @@ class GetOrWaiteQuizzesView(APIView):
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
         # 1. DB에서 준비된 퀴즈가 있는지 확인
-        quizzes_to_play = FirstGameQuiz.objects.filter(user=user, is_ready=True).order_by('created_at')[:3]
+        ready_quizzes = FirstGameQuiz.objects.filter(user=user, is_ready=True)
+        depth = ready_quizzes.count()
+        record_quiz_pool_request(user_id, depth)
+        quizzes_to_play = ready_quizzes.order_by('created_at')[:QUIZ_SET_SIZE]
 
-        if quizzes_to_play.count() >= 3:
+        if depth >= QUIZ_SET_SIZE:
             # 퀴즈가 3개 이상 있으면, 퀴즈와 함께 'ready' 신호 반환
             serializer = FirstGameQuizSerializer(quizzes_to_play, many=True)
             return Response({"status": "ready", "quizzes": serializer.data}, status=status.HTTP_200_OK)
@@ -18,6 +18,17 @@ class User(models.Model):
     game1_analysis = models.JSONField(null=True, blank=True, default=dict)
     game2_analysis = models.JSONField(null=True, blank=True, default=dict)
     game3_analysis = models.JSONField(null=True, blank=True, default=dict)
+    # 분석에 사용한 프롬프트(통계 데이터 + 템플릿 + 모델)의 sha256. 같으면 Gemini 를 다시 호출하지 않습니다.
+    game1_analysis_hash = models.CharField(max_length=64, null=True, blank=True)
+    game2_analysis_hash = models.CharField(max_length=64, null=True, blank=True)
+    game3_analysis_hash = models.CharField(max_length=64, null=True, blank=True)
+    game1_analyzed_at = models.DateTimeField(null=True, blank=True)
+    game2_analyzed_at = models.DateTimeField(null=True, blank=True)
+    game3_analyzed_at = models.DateTimeField(null=True, blank=True)
+    # 마지막으로 통계를 확인한 시각. 통계가 같아 분석을 건너뛴 경우에도 갱신됩니다. (야간 분석 대상 선정용, analyzed_at 은 AI_ANALYSIS_CACHE_TTL 기준)
+    game1_checked_at = models.DateTimeField(null=True, blank=True)
+    game2_checked_at = models.DateTimeField(null=True, blank=True)
+    game3_checked_at = models.DateTimeField(null=True, blank=True)
 
 
     class Meta:
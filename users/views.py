@@ -4,8 +4,7 @@ from rest_framework import status
 from .models import User
 from .serializers import UserSignupSerializer, UserDetailSerializer
 from item.models import Item
-from games.views import create_quiz_set # games.views 에서 함수 import
-import concurrent.futures
+from games.task import request_quiz_pool_refill
 
 
 class UserSignupView(APIView):
@@ -117,13 +116,8 @@ class UserLoginView(APIView):
             serializer = UserDetailSerializer(user)
             response_data = {'message': 'Login successful', 'user': serializer.data}
 
-            # 백그라운드에서 이미지 포함 퀴즈 세트 생성
-            def background_task():
-                create_quiz_set(user.user_id)  # 예: 이미지 생성 포함
-
-            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-            executor.submit(background_task)
-            executor.shutdown(wait=False)
+            # 준비된 퀴즈가 부족할 때만 백그라운드 생성 (사용자당 하나의 작업만 실행, 중복 로그인 시 새로 시작하지 않음)
+            request_quiz_pool_refill(user.user_id)
 
             return Response(response_data, status=status.HTTP_200_OK)
         else: